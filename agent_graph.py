@@ -1,13 +1,16 @@
 # agent_graph.py
 import json
-from typing import TypedDict, Literal, Any, Dict, List, Optional
+import threading
+from collections import OrderedDict
+from typing import TypedDict, Literal, Any, Dict, List, Optional, Tuple
 
-from langchain_openai import ChatOpenAI
 from langchain.prompts import ChatPromptTemplate
 from langgraph.graph import StateGraph, END
 
-from rag_system import DirectoryRAG
-from tools import check_product_inventory, create_order, get_order_status
+from backends import make_llm
+from rag_system import NODE_SHARDS, ShardedRAG, get_shared_rag
+from resilience import UPSTREAMS, TURN_BUDGET, new_deadline, remaining
+from tools import check_product_inventory, create_order, get_order_status, lookup_orders
 
 
 # --- Définition de l'état du graphe ---
@@ -21,11 +24,29 @@ class ChatState(TypedDict, total=False):
     answer: str
     trace: List[str]
     order_details: Optional[Dict[str, Any]]
+    # budget de latence du tour (s) et échéance absolue (epoch) qui en découle
+    turn_budget: float
+    deadline: float
+    # email du client authentifié par l'hôte (jamais déduit des messages)
+    customer_email: Optional[str]
 
 
 # --- Initialisation des composants ---
-rag = DirectoryRAG(folder_path="donnees", k=3)
-llm = ChatOpenAI(model="gpt-4o", temperature=0)
+RAG_FOLDER = "donnees"
+llm = make_llm()
+
+# Index injecté par l'hôte (ex. st.cache_resource dans app.py) ; à défaut,
+# l'index partagé du processus, construit au premier besoin.
+_rag: Optional[ShardedRAG] = None
+
+
+def use_rag(rag: ShardedRAG) -> None:
+    global _rag
+    _rag = rag
+
+
+def get_rag() -> ShardedRAG:
+    return _rag if _rag is not None else get_shared_rag(RAG_FOLDER)
 
 
 # --- Prompts (accolades doublées pour JSON littéral !) ---
@@ -64,8 +85,11 @@ prompt_commande = ChatPromptTemplate.from_messages([
 
 prompt_status = ChatPromptTemplate.from_messages([
     ("system",
-     "Si l'utilisateur demande le statut d'une commande, renvoie un JSON littéral EXACT : "
-     "{{\"tool\": \"get_order_status\", \"order_id\": 123}}."),
+     "Si l'utilisateur demande le statut d'une seule commande, renvoie un JSON littéral EXACT : "
+     "{{\"tool\": \"get_order_status\", \"order_id\": 123}}.\n"
+     "S'il demande plusieurs commandes, ou toutes ses commandes à partir de son email, renvoie un JSON littéral EXACT : "
+     "{{\"tool\": \"lookup_orders\", \"order_ids\": [12, 15]}} ou "
+     "{{\"tool\": \"lookup_orders\", \"customer_email\": \"<email>\", \"page\": 1}}."),
     ("user", "{query}")
 ])
 
@@ -83,22 +107,91 @@ def try_parse_json(text: str) -> Optional[Dict[str, Any]]:
         return None
 
 
-def _safe_tool_call(tool_fn, payload: Dict) -> str:
-    """Appelle un outil LangChain (@tool) en passant un dict avec les bons champs."""
+def _safe_tool_call(tool_fn, payload: Dict, state: Optional[ChatState] = None,
+                    idempotent: bool = True) -> str:
+    """
+    Appelle un outil LangChain (@tool) en passant un dict avec les bons champs.
+    Les outils de lecture sont bornés par le budget du tour ; une écriture
+    (idempotent=False) n'est jamais abandonnée en cours ni rejouée.
+    """
+    deadline = (state or {}).get("deadline")
+    try:
+        if not idempotent:
+            if remaining(deadline) <= 0:
+                return f"[outil:{tool_fn.name}] délai dépassé, opération non effectuée."
+            return tool_fn.invoke(payload)
+        return UPSTREAMS["tools"].call(lambda: tool_fn.invoke(payload), deadline)
+    except Exception as e:
+        return f"[outil:{tool_fn.name}] erreur: {e}"
+
+
+def _llm(state: ChatState, msg) -> str:
+    """Appel LLM borné par le budget du tour (délais, retries, disjoncteur)."""
+    return UPSTREAMS["llm"].call(lambda: llm.invoke(msg), state.get("deadline")).content.strip()
+
+
+def _context(state: ChatState, q: str, node: str) -> str:
+    """Contexte RAG des shards du nœud ; en cas d'échec de l'amont, on répond sans contexte."""
+    shards, k = NODE_SHARDS[node]
     try:
-        return tool_fn(payload)
+        rag = get_rag()  # construction initiale hors budget d'appel
+        return UPSTREAMS["embeddings"].call(
+            lambda: rag.make_context(q, shards=shards, k=k, strict=True), state.get("deadline"))
     except Exception as e:
-        return f"[outil:{getattr(tool_fn, 'name', tool_fn.__name__)}] erreur: {e}"
+        state.setdefault("trace", []).append(f"[rag] sans contexte : {e}")
+        return ""
+
+
+# Dernières réponses libres par (nœud, question), servies si l'amont est dégradé
+ANSWER_CACHE_SIZE = 256
+_answer_cache: "OrderedDict[Tuple[str, str], str]" = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+
+def _cache_key(node: str, q: str) -> Tuple[str, str]:
+    return node, " ".join(q.lower().split())
+
+
+def _remember_answer(node: str, q: str, answer: str) -> None:
+    with _answer_cache_lock:
+        _answer_cache[_cache_key(node, q)] = answer
+        _answer_cache.move_to_end(_cache_key(node, q))
+        while len(_answer_cache) > ANSWER_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+
+def _cached_intent(q: str) -> Optional[str]:
+    with _answer_cache_lock:
+        for node, intent in (("support", "SUPPORT"), ("vente", "VENTE")):
+            if _cache_key(node, q) in _answer_cache:
+                return intent
+    return None
+
+
+def _degraded(state: ChatState, node: str, error: Exception) -> ChatState:
+    """Repli quand le LLM ne répond pas : réponse en cache, sinon escalade."""
+    q = state.get("user_query", "")
+    state.setdefault("trace", []).append(f"[{node}] amont dégradé : {error}")
+    with _answer_cache_lock:
+        cached = _answer_cache.get(_cache_key(node, q))
+    if cached is not None:
+        state["answer"] = cached
+        state["trace"].append(f"[{node}] réponse en cache")
+        return state
+    return agent_handover(state)
 
 
 # --- Nœuds du graphe ---
 def detect_intent(state: ChatState) -> ChatState:
     q = state.get("user_query", "")
+    # nœud d'entrée : ouvre le budget de latence du tour
+    state["deadline"] = new_deadline(state.get("turn_budget", TURN_BUDGET))
     msg = intent_template.format_messages(query=q)
     try:
-        resp = llm.invoke(msg).content.strip().upper()
+        resp = _llm(state, msg).upper()
     except Exception as e:
-        state["intent"] = "HANDOVER"
+        # amont dégradé : si une réponse est en cache, le nœud concerné la servira
+        state["intent"] = _cached_intent(q) or "HANDOVER"
         state.setdefault("trace", []).append(f"[intent] erreur LLM: {e}")
         return state
 
@@ -125,52 +218,50 @@ def detect_intent(state: ChatState) -> ChatState:
 
 def agent_support(state: ChatState) -> ChatState:
     q = state.get("user_query", "")
-    ctx = rag.make_context(q)
+    ctx = _context(state, q, "support")
     msg = prompt_support.format_messages(query=q, ctx=ctx)
     try:
-        resp = llm.invoke(msg).content.strip()
+        resp = _llm(state, msg)
     except Exception as e:
-        resp = f"Désolé, une erreur est survenue côté support : {e}"
+        return _degraded(state, "support", e)
     state["answer"] = resp
+    _remember_answer("support", q, resp)
     state.setdefault("trace", []).append("[support] réponse modèle")
     return state
 
 
 def agent_vente(state: ChatState) -> ChatState:
     q = state.get("user_query", "")
-    ctx = rag.make_context(q)
+    ctx = _context(state, q, "vente")
     msg = prompt_vente.format_messages(query=q, ctx=ctx)
     try:
-        resp = llm.invoke(msg).content.strip()
+        resp = _llm(state, msg)
     except Exception as e:
-        state["answer"] = f"Désolé, une erreur est survenue côté vente : {e}"
-        state.setdefault("trace", []).append("[vente] erreur LLM")
-        return state
+        return _degraded(state, "vente", e)
 
     state.setdefault("trace", []).append("[vente] réponse modèle brut")
     parsed = try_parse_json(resp)
     if parsed and parsed.get("tool") == "check_product_inventory" and "name" in parsed:
         # ✅ passer le bon payload attendu par @tool
         payload = {"product_name": parsed["name"]}
-        tool_res = _safe_tool_call(check_product_inventory, payload)
+        tool_res = _safe_tool_call(check_product_inventory, payload, state)
         state["answer"] = tool_res
         state["trace"].append(
             f"[vente] outil check_product_inventory payload={payload}")
     else:
         state["answer"] = resp
+        _remember_answer("vente", q, resp)
     return state
 
 
 def agent_commande(state: ChatState) -> ChatState:
     q = state.get("user_query", "")
-    ctx = rag.make_context(q)
+    ctx = _context(state, q, "commande")
     msg = prompt_commande.format_messages(query=q, ctx=ctx)
     try:
-        resp = llm.invoke(msg).content.strip()
+        resp = _llm(state, msg)
     except Exception as e:
-        state["answer"] = f"Désolé, une erreur est survenue côté commande : {e}"
-        state.setdefault("trace", []).append("[commande] erreur LLM")
-        return state
+        return _degraded(state, "commande", e)
 
     state.setdefault("trace", []).append("[commande] réponse modèle brut")
     parsed = try_parse_json(resp)
@@ -178,7 +269,7 @@ def agent_commande(state: ChatState) -> ChatState:
     if parsed and parsed.get("tool") == "create_order" and "order_details" in parsed:
         # ✅ passer le bon payload attendu par @tool
         payload = {"order_details": parsed["order_details"]}
-        tool_res = _safe_tool_call(create_order, payload)
+        tool_res = _safe_tool_call(create_order, payload, state, idempotent=False)
         state["answer"] = tool_res
         state["trace"].append(
             f"[commande] outil create_order payload=order_details")
@@ -187,11 +278,9 @@ def agent_commande(state: ChatState) -> ChatState:
     # sinon on tente un statut de commande
     msg2 = prompt_status.format_messages(query=q)
     try:
-        resp2 = llm.invoke(msg2).content.strip()
+        resp2 = _llm(state, msg2)
     except Exception as e:
-        state["answer"] = f"Désolé, une erreur est survenue côté statut de commande : {e}"
-        state["trace"].append("[commande] erreur LLM (status)")
-        return state
+        return _degraded(state, "commande", e)
 
     parsed2 = try_parse_json(resp2)
     if parsed2 and parsed2.get("tool") == "get_order_status" and "order_id" in parsed2:
@@ -200,10 +289,29 @@ def agent_commande(state: ChatState) -> ChatState:
         except Exception:
             oid = parsed2["order_id"]
         payload = {"order_id": oid}
-        tool_res2 = _safe_tool_call(get_order_status, payload)
+        tool_res2 = _safe_tool_call(get_order_status, payload, state)
         state["answer"] = tool_res2
         state["trace"].append(
             f"[commande] outil get_order_status payload={payload}")
+    elif parsed2 and parsed2.get("tool") == "lookup_orders" and (
+            parsed2.get("order_ids") or parsed2.get("customer_email")):
+        payload = {
+            k: parsed2[k]
+            for k in ("order_ids", "customer_email", "page", "page_size")
+            if parsed2.get(k) is not None
+        }
+        if "order_ids" not in payload and not _is_session_email(state, payload["customer_email"]):
+            # n'importe qui peut taper un email : l'historique n'est listé que
+            # pour le client authentifié de la session
+            state["answer"] = (
+                "Pour protéger vos données, je ne peux lister les commandes d'une adresse email "
+                "que si vous êtes connecté avec celle-ci. Indiquez-moi plutôt vos numéros de commande.")
+            state["trace"].append("[commande] lookup_orders par email refusé (identité non vérifiée)")
+            return state
+        tool_res2 = _safe_tool_call(lookup_orders, payload, state)
+        state["answer"] = tool_res2
+        state["trace"].append(
+            f"[commande] outil lookup_orders payload={payload}")
     else:
         # pas d'appel d'outil, on renvoie la réponse libre
         state["answer"] = resp
@@ -211,6 +319,11 @@ def agent_commande(state: ChatState) -> ChatState:
     return state
 
 
+def _is_session_email(state: ChatState, email: Any) -> bool:
+    verified = state.get("customer_email")
+    return bool(verified) and isinstance(email, str) and email.strip().lower() == verified.strip().lower()
+
+
 def agent_handover(state: ChatState) -> ChatState:
     state["answer"] = "Votre demande dépasse mes capacités. Je la transfère à un agent humain."
     state.setdefault("trace", []).append("[handover] escalade")
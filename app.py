@@ -8,34 +8,54 @@ import streamlit as st
 from dotenv import load_dotenv
 from langchain_core.messages import HumanMessage, AIMessage
 
-from agent_graph import GRAPH
+from agent_graph import GRAPH, RAG_FOLDER, use_rag
+from rag_system import get_shared_rag, shared_memory_report
 
 load_dotenv()
 
 st.set_page_config(page_title="SunuTech Chatbot", layout="wide")
 st.title("SunuTech — Agent Chat")
 
+
+@st.cache_resource(show_spinner="Indexation des documents…")
+def load_rag():
+    """
+    Index unique pour toutes les sessions : le cache survit aux reruns et
+    aux rechargements de modules par le file-watcher de `streamlit run`.
+    Seul un changement dans `donnees` reconstruit l'index.
+    """
+    return get_shared_rag(RAG_FOLDER)
+
+
+use_rag(load_rag())
+
+
+def _mo(n: int | None) -> str:
+    return "n/d" if n is None else f"{n / 2**20:.1f} Mo"
+
+
+with st.sidebar:
+    mem = shared_memory_report()
+    st.caption(
+        f"Mémoire processus : {_mo(mem['process_rss_bytes'])} — "
+        f"index : {mem['chunks']} chunks, {_mo(mem['index_bytes'])}"
+    )
+
 # --- état session ---
 if "chat_state" not in st.session_state:
     st.session_state.chat_state = {"messages": []}
 
-# conteneur unique pour le chat
-chat_container = st.container()
+# nombre de tours (question + réponse) affichés, puis ajoutés par "charger plus"
+HISTORY_PAGE_TURNS = 10
 
+if "history_turns" not in st.session_state:
+    st.session_state.history_turns = HISTORY_PAGE_TURNS
+# markdown déjà converti, parallèle à chat_state["messages"] (ajout seulement)
+if "rendered_md" not in st.session_state:
+    st.session_state.rendered_md = []
 
-def render_messages_once(msgs: list[Any]) -> None:
-    """Render each message exactly once in the container."""
-    with chat_container:
-        for msg in msgs:
-            if isinstance(msg, HumanMessage):
-                with st.chat_message("user"):
-                    st.markdown(_to_text(msg.content))
-            elif isinstance(msg, AIMessage):
-                with st.chat_message("assistant"):
-                    st.markdown(_to_text(msg.content))
-            else:
-                with st.chat_message("assistant"):
-                    st.markdown(_to_text(msg))
+# conteneur unique pour le chat
+chat_container = st.container()
 
 
 def _to_text(content: Any) -> str:
@@ -47,6 +67,52 @@ def _to_text(content: Any) -> str:
         return str(content)
 
 
+def _role(msg: Any) -> str:
+    return "user" if isinstance(msg, HumanMessage) else "assistant"
+
+
+def _markdown_for(msgs: list[Any], idx: int) -> str:
+    """Markdown du message 'idx', converti une seule fois par session."""
+    cache: list[str] = st.session_state.rendered_md
+    if len(cache) > len(msgs):  # historique remplacé (reset, erreur…)
+        del cache[:]
+    for msg in msgs[len(cache):idx + 1]:
+        content = msg.content if isinstance(msg, (HumanMessage, AIMessage)) else msg
+        cache.append(_to_text(content))
+    return cache[idx]
+
+
+def _window_start(msgs: list[Any], turns: int) -> int:
+    """Index du premier message des 'turns' derniers tours."""
+    seen = 0
+    for i in range(len(msgs) - 1, -1, -1):
+        if isinstance(msgs[i], HumanMessage):
+            seen += 1
+            if seen == turns:
+                return i
+    return 0
+
+
+def render_message(msgs: list[Any], idx: int) -> None:
+    with chat_container:
+        with st.chat_message(_role(msgs[idx])):
+            st.markdown(_markdown_for(msgs, idx))
+
+
+def render_history(msgs: list[Any]) -> None:
+    """Render only the most recent turns, with a button to load earlier ones."""
+    start = _window_start(msgs, st.session_state.history_turns)
+    if start > 0:
+        with chat_container:
+            st.caption(f"{start} messages plus anciens masqués")
+            # libellé et clé fixes : l'ID du widget ne doit pas changer d'un run à l'autre
+            if st.button("Afficher les messages précédents", key="load_earlier"):
+                st.session_state.history_turns += HISTORY_PAGE_TURNS
+                st.rerun()
+    for idx in range(start, len(msgs)):
+        render_message(msgs, idx)
+
+
 def append_message(state: dict, msg: Any) -> None:
     state.setdefault("messages", []).append(msg)
 
@@ -56,6 +122,8 @@ def call_graph_with_input(user_text: str) -> dict:
 
     human = HumanMessage(content=user_text)
     append_message(st_state, human)
+    # affiché tout de suite : la question ne sera plus re-rendue dans ce run
+    render_message(st_state["messages"], len(st_state["messages"]) - 1)
 
     st_state["user_query"] = user_text
 
@@ -78,19 +146,19 @@ def call_graph_with_input(user_text: str) -> dict:
 # --- bouton reset ---
 if st.button("Réinitialiser la conversation"):
     st.session_state.chat_state = {"messages": []}
+    st.session_state.history_turns = HISTORY_PAGE_TURNS
+    st.session_state.rendered_md = []
     st.rerun()  # remplace experimental_rerun()
 
-# --- afficher tout l'historique une seule fois ---
-render_messages_once(st.session_state.chat_state.get("messages", []))
+# --- afficher les derniers tours de l'historique, une seule fois ---
+render_history(st.session_state.chat_state.get("messages", []))
 
 # --- entrée utilisateur ---
 if user_input := st.chat_input("Votre question…"):
     new_state = call_graph_with_input(user_input)
-    # n'affiche ici **que** le dernier message AI (ou nouveau message)
-    # pour éviter doublons, on ne réaffiche pas tout l'historique
-    last_msg = new_state.get(
-        "messages", [])[-1] if new_state.get("messages") else None
-    if isinstance(last_msg, AIMessage):
-        with chat_container:
-            with st.chat_message("assistant"):
-                st.markdown(_to_text(last_msg.content))
+    # n'affiche ici **que** le nouveau message AI : l'historique et la
+    # question sont déjà rendus, et au prochain run il fera partie de
+    # l'historique (markdown déjà en cache)
+    msgs = new_state.get("messages", [])
+    if msgs and isinstance(msgs[-1], AIMessage):
+        render_message(msgs, len(msgs) - 1)
@@ -0,0 +1,205 @@
+# backends.py
+"""
+Fabrique des backends LLM / embeddings.
+
+Par défaut : OpenAI (gpt-4o, text-embedding-3-small). Avec la variable
+d'environnement SUNUTECH_FAKE_BACKENDS=1, des backends locaux et
+déterministes sont utilisés à la place (pas de réseau ni de clé API) :
+utile pour tester le service HTTP ou générer de la charge.
+
+Latence simulée (SUNUTECH_FAKE_LLM_LATENCY_MS, SUNUTECH_FAKE_EMBED_LATENCY_MS) :
+    "300"                  fixe, en ms
+    "uniform:100:500"      uniforme entre deux bornes (ms)
+    "lognormal:800:0.5"    log-normale de médiane 800 ms et sigma 0.5
+"""
+
+import hashlib
+import json
+import math
+import os
+import random
+import re
+import time
+import unicodedata
+from typing import Any, Callable, List, Optional
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.messages import AIMessage
+
+from resilience import EMBED_CALL_TIMEOUT, LLM_CALL_TIMEOUT
+
+LLM_MODEL = "gpt-4o"
+EMBEDDING_MODEL = "text-embedding-3-small"
+# Indexation (hors tour, par lots de documents) : délai long et retries du client
+INDEX_EMBED_TIMEOUT = 60.0
+INDEX_EMBED_RETRIES = 6
+
+
+def use_fake_backends() -> bool:
+    return os.getenv("SUNUTECH_FAKE_BACKENDS", "").lower() in ("1", "true", "yes")
+
+
+def latency_distribution(spec: str, seed: Optional[int] = None) -> Optional[Callable[[], float]]:
+    """Tirage de latences (s) d'après une spécification (voir en-tête du module)."""
+    spec = (spec or "").strip()
+    if not spec:
+        return None
+    kind, _, params = spec.partition(":") if ":" in spec else ("fixed", "", spec)
+    values = [float(v) for v in params.split(":")]
+    rng = random.Random(seed)
+    if kind == "fixed" and values[0] > 0:
+        return lambda: values[0] / 1000.0
+    if kind == "uniform":
+        return lambda: rng.uniform(values[0], values[1]) / 1000.0
+    if kind == "lognormal":
+        median_ms, sigma = values
+        return lambda: rng.lognormvariate(math.log(median_ms), sigma) / 1000.0
+    if kind == "fixed":
+        return None
+    raise ValueError(f"Distribution de latence inconnue : {spec}")
+
+
+def _env_latency(env_var: str) -> Optional[Callable[[], float]]:
+    return latency_distribution(os.getenv(env_var, ""))
+
+
+def make_llm():
+    if use_fake_backends():
+        return FakeChatModel(latency=_env_latency("SUNUTECH_FAKE_LLM_LATENCY_MS"))
+    from langchain_openai import ChatOpenAI
+    # retries et délais globaux gérés par resilience.Upstream ; ce délai
+    # client libère le thread d'un appel abandonné
+    return ChatOpenAI(model=LLM_MODEL, temperature=0,
+                      timeout=LLM_CALL_TIMEOUT, max_retries=0)
+
+
+def make_embeddings() -> Embeddings:
+    if use_fake_backends():
+        return HashingEmbeddings(latency=_env_latency("SUNUTECH_FAKE_EMBED_LATENCY_MS"))
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL,
+                            timeout=EMBED_CALL_TIMEOUT, max_retries=0)
+
+
+def make_index_embeddings() -> Embeddings:
+    """
+    Client d'embeddings pour construire les index : hors du budget d'un
+    tour, il garde un délai long et les nouvelles tentatives du client
+    (un 429 en pleine indexation ne doit pas faire échouer la construction).
+    """
+    if use_fake_backends():
+        return make_embeddings()
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL,
+                            timeout=INDEX_EMBED_TIMEOUT, max_retries=INDEX_EMBED_RETRIES)
+
+
+# --- Backends locaux ---
+def _normalize(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Embeddings hors-ligne : sac de mots et trigrammes de caractères hachés
+    (blake2b, stable d'un processus à l'autre) dans un vecteur normalisé.
+    Assez proche du lexical pour que la recherche reste pertinente.
+    """
+
+    def __init__(self, size: int = 384, latency: Optional[Callable[[], float]] = None):
+        self.size = size
+        self.latency = latency
+
+    def _embed(self, text: str) -> List[float]:
+        vec = [0.0] * self.size
+        words = re.findall(r"\w+", _normalize(text))
+        grams = [w[i:i + 3] for w in words if len(w) > 3 for i in range(len(w) - 2)]
+        for feature, weight in [(w, 1.0) for w in words] + [(g, 0.5) for g in grams]:
+            h = int.from_bytes(hashlib.blake2b(feature.encode(), digest_size=8).digest(), "little")
+            vec[h % self.size] += weight if (h >> 63) else -weight
+        norm = math.sqrt(sum(v * v for v in vec)) or 1.0
+        return [v / norm for v in vec]
+
+    def _sleep(self):
+        if self.latency is not None:
+            time.sleep(self.latency())
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._sleep()
+        return [self._embed(t) for t in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._sleep()
+        return self._embed(text)
+
+
+# IDs des produits insérés par `python setup_db.py`
+_PRODUCT_IDS = [
+    ("pc basic", 1), ("pc gamer", 2), ("serveur", 3), ("ssd 1", 4), ("ssd 2", 5),
+    ("ram 16", 6), ("ram 32", 7), ("moniteur", 8), ("clavier", 9), ("souris", 10),
+]
+_PRODUCT_NAMES = ["PC", "SSD", "RAM", "Moniteur", "Clavier", "Souris", "Serveur"]
+
+_INTENT_KEYWORDS = [
+    ("AUREVOIR", ["au revoir", "bye", "bonne journee", "a bientot"]),
+    ("REMERCIEMENT", ["merci", "thanks"]),
+    ("SALUTATION", ["bonjour", "salut", "hello", "bonsoir"]),
+    ("COMMANDE", ["commande", "commander", "acheter", "achat", "je prends"]),
+    ("VENTE", ["prix", "stock", "disponible", "avez-vous", "cherche", "combien"]),
+    ("SUPPORT", ["comment", "installer", "garantie", "retour", "panne", "probleme", "bios"]),
+]
+
+
+class FakeChatModel:
+    """
+    Stand-in de ChatOpenAI pour les prompts de agent_graph : répond par
+    mots-clés, et renvoie les JSON d'outils attendus par chaque agent.
+    """
+
+    def __init__(self, latency: Optional[Callable[[], float]] = None):
+        self.latency = latency
+
+    def invoke(self, messages: List[Any], **kwargs) -> AIMessage:
+        if self.latency is not None:
+            time.sleep(self.latency())
+        system = _normalize(messages[0].content) if messages else ""
+        user = messages[-1].content if messages else ""
+        return AIMessage(content=self._answer(system, user))
+
+    def _answer(self, system: str, user: str) -> str:
+        query = _normalize(user.split("\n\nCONTEXTE :")[0])
+        if "detecteur d'intention" in system:
+            for intent, words in _INTENT_KEYWORDS:
+                if any(w in query for w in words):
+                    return intent
+            return "HANDOVER"
+        if "agent commercial" in system:
+            for name in _PRODUCT_NAMES:
+                if _normalize(name) in query:
+                    return json.dumps({"tool": "check_product_inventory", "name": name})
+            return "Pouvez-vous préciser le produit recherché ?"
+        if "agent de commande" in system:
+            email = re.search(r"[\w.+-]+@[\w-]+\.[\w.]+", user)
+            items = [
+                {"product_id": pid,
+                 "quantity": int(m.group(1)) if (m := re.search(rf"(\d+)\s+{key}", query)) else 1}
+                for key, pid in _PRODUCT_IDS if key in query
+            ]
+            if email and items and any(w in query for w in ("commander", "acheter", "je prends", "je veux")):
+                return json.dumps({"tool": "create_order", "order_details": {
+                    "customer_name": "Client", "customer_email": email.group(0),
+                    "address": "", "items": items}})
+            return "Pouvez-vous préciser les articles et votre email ?"
+        if "statut d'une seule commande" in system:
+            ids = [int(n) for n in re.findall(r"\b\d+\b", query)]
+            email = re.search(r"[\w.+-]+@[\w-]+\.[\w.]+", user)
+            if len(ids) == 1:
+                return json.dumps({"tool": "get_order_status", "order_id": ids[0]})
+            if ids:
+                return json.dumps({"tool": "lookup_orders", "order_ids": ids})
+            if email:
+                return json.dumps({"tool": "lookup_orders", "customer_email": email.group(0)})
+            return "Pouvez-vous me donner le numéro de commande ?"
+        ctx = user.split("\n\nCONTEXTE :\n", 1)[1] if "\n\nCONTEXTE :\n" in user else ""
+        return "D'après notre documentation : " + (ctx[:300].strip() or "je n'ai pas trouvé d'information.")
@@ -0,0 +1,517 @@
+# eval_retrieval.py
+"""
+Évaluation de la recherche documentaire et balayage des paramètres du
+découpage : pour chaque combinaison (taille de chunk, chevauchement, k,
+type d'index FAISS), mesure recall@k et MRR sur un jeu de questions
+étiquetées, ainsi que le temps de construction, la taille de l'index, la
+latence de recherche et le nombre de tokens du contexte envoyé au LLM.
+Affiche le front de Pareto qualité / coût.
+
+    python eval_retrieval.py                       # FAQ de donnees/, embeddings locaux
+    python eval_retrieval.py --chunk-sizes 300,800 --overlaps 0,100 --ks 2,3 --all
+    python eval_retrieval.py --save-questions questions.jsonl   # puis compléter à la main
+    python eval_retrieval.py --questions questions.jsonl --shard faq --report eval.json
+    python eval_retrieval.py --node support --ks 2,3,4 --shard-ks 2,3
+
+Jeu de questions : par défaut, les paires « Q : ... / R : ... » trouvées
+dans le corpus. Ces questions figurant mot pour mot dans les documents,
+les lignes « Q : » des .txt sont retirées d'une copie du corpus avant
+l'évaluation : sinon toute configuration les retrouve (recall 1). Ce jeu
+reste petit, à compléter pour départager les configurations. Format JSONL, une question par ligne :
+    {"question": "...", "source": "faq_sunatech.txt", "answer": "extrait attendu"}
+'answer' est optionnel : sans lui, tout chunk de 'source' est pertinent ;
+avec lui, seul un chunk qui en couvre au moins la moitié l'est (ou dont au
+moins la moitié est de la réponse, si les chunks sont plus petits).
+
+Les embeddings sont locaux par défaut (backends.HashingEmbeddings, hors
+ligne) : les chiffres absolus diffèrent d'OpenAI (--embedder openai), mais
+les compromis entre configurations restent comparables. 'flat-l2'
+correspond à l'index construit par rag_system (FAISS.from_texts).
+
+Le balayage par défaut interroge un seul index plat (tout le corpus ou
+--shard) : il sert à régler le découpage et le type d'index. En
+production, chaque nœud interroge plusieurs shards (NODE_SHARDS), chacun
+avec son k (SHARDS), puis garde les k meilleurs après fusion. Pour régler
+ces k, --node passe par ShardedRAG.retrieve, comme le graphe, sur les
+questions dont la source appartient aux shards du nœud ; k est alors le
+nombre de chunks gardés après fusion et --shard-ks le k de chaque shard
+(par défaut ceux de SHARDS).
+"""
+
+import argparse
+import itertools
+import json
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import faiss
+import numpy as np
+from langchain.text_splitter import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+from backends import LLM_MODEL, HashingEmbeddings
+from rag_system import (CHUNK_OVERLAP, CHUNK_SIZE, NODE_SHARDS, SHARDS, FileFilter, ShardedRAG,
+                        corpus_files, load_documents, shard_of)
+from resilience import percentile
+
+DEFAULT_CHUNK_SIZES = f"200,400,{CHUNK_SIZE},1200"
+DEFAULT_OVERLAPS = f"0,50,{CHUNK_OVERLAP},200"
+DEFAULT_KS = "1,2,3,5"
+# Tous en distance L2 sur les vecteurs bruts, comme FAISS.from_texts. Pas de
+# variante produit scalaire : les embeddings (locaux comme OpenAI) sont déjà
+# normés, L2 et cosinus y donnent le même classement.
+INDEX_TYPES = ["flat-l2", "hnsw", "sq8"]
+HNSW_M = 32
+HNSW_EF_SEARCH = 64
+# Critères du front de Pareto : (clé, +1 à maximiser / -1 à minimiser, tolérance
+# relative sous laquelle deux valeurs sont jugées égales : bruit de mesure)
+PARETO_OBJECTIVES = [("recall", 1, 0.0), ("mrr", 1, 0.0), ("context_tokens", -1, 0.0),
+                     ("search_p50_ms", -1, 0.2)]
+
+_QUESTION_RE = re.compile(r"^Q\s*:\s*(.+?)\s*$", re.M)
+_QUESTION_LINE_RE = re.compile(r"^Q\s*:.*(?:\n|$)", re.M)
+# En dessous, les écarts de recall entre configurations sont peu significatifs
+MIN_QUESTIONS = 20
+_ANSWER_PREFIX_RE = re.compile(r"^R\s*:\s*")
+
+
+class Chunk:
+    __slots__ = ("doc", "source", "start", "end", "text")
+
+    def __init__(self, doc: int, source: str, start: int, text: str):
+        self.doc = doc
+        self.source = source
+        self.start = start
+        self.end = start + len(text)
+        self.text = text
+
+
+class Label:
+    """Question étiquetée, résolue en passages pertinents (document, début, fin)."""
+
+    def __init__(self, question: str, source: str, spans: List[Tuple[int, int, int]]):
+        self.question = question
+        self.source = source
+        self.spans = spans
+
+    def is_relevant(self, chunk: Chunk) -> bool:
+        for doc, start, end in self.spans:
+            if chunk.doc != doc:
+                continue
+            overlap = min(end, chunk.end) - max(start, chunk.start)
+            if overlap > 0 and overlap >= 0.5 * min(end - start, chunk.end - chunk.start):
+                return True
+        return False
+
+
+# --- Corpus et jeu de questions ---
+def _relative_source(folder_path: Path, doc: Document) -> str:
+    source = Path(doc.metadata.get("source", ""))
+    try:
+        return source.relative_to(folder_path).as_posix()
+    except ValueError:
+        return source.as_posix()
+
+
+def faq_questions(folder_path: Path, docs: Sequence[Document]) -> List[Dict[str, str]]:
+    """Paires « Q : ... / R : ... » du corpus, la réponse servant d'étiquette."""
+    items = []
+    for doc in docs:
+        text = doc.page_content
+        matches = list(_QUESTION_RE.finditer(text))
+        for i, m in enumerate(matches):
+            end = matches[i + 1].start() if i + 1 < len(matches) else len(text)
+            answer = _ANSWER_PREFIX_RE.sub("", text[m.end():end].strip())
+            if answer:
+                items.append({"question": m.group(1), "source": _relative_source(folder_path, doc),
+                              "answer": answer})
+    return items
+
+
+def without_questions(folder_path: Path, target: Path) -> Path:
+    """Copie du corpus dans 'target', sans les lignes « Q : » des fichiers .txt."""
+    for path in corpus_files(folder_path):
+        dest = target / path.relative_to(folder_path)
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        if path.suffix.lower() == ".txt":
+            text = path.read_text(encoding="utf-8")
+            dest.write_text(_QUESTION_LINE_RE.sub("", text), encoding="utf-8")
+        else:
+            shutil.copyfile(path, dest)
+    return target
+
+
+def load_questions(path: Path) -> List[Dict[str, str]]:
+    items = []
+    with path.open(encoding="utf-8") as f:
+        for n, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if not item.get("question") or not item.get("source"):
+                raise ValueError(f"{path}:{n} : 'question' et 'source' sont obligatoires")
+            items.append(item)
+    return items
+
+
+def resolve_labels(folder_path: Path, docs: Sequence[Document],
+                   items: Sequence[Dict[str, str]]) -> List[Label]:
+    labels = []
+    sources = [_relative_source(folder_path, doc) for doc in docs]
+    for item in items:
+        doc_ids = [i for i, src in enumerate(sources) if src == item["source"]]
+        if not doc_ids:
+            print(f"[Warning] source absente du corpus, question ignorée : {item['source']}")
+            continue
+        answer = (item.get("answer") or "").strip()
+        spans = []
+        for i in doc_ids:
+            pos = docs[i].page_content.find(answer) if answer else -1
+            if pos >= 0:
+                spans.append((i, pos, pos + len(answer)))
+        if answer and not spans:
+            print(f"[Warning] réponse introuvable dans {item['source']}, tout le fichier compte : "
+                  f"{item['question']}")
+        if not spans:
+            spans = [(i, 0, len(docs[i].page_content)) for i in doc_ids]
+        labels.append(Label(item["question"], item["source"], spans))
+    return labels
+
+
+def split_corpus(folder_path: Path, docs: Sequence[Document], chunk_size: int,
+                 chunk_overlap: int) -> List[Chunk]:
+    """Même découpage que rag_system, avec la position de chaque chunk dans son document."""
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks = []
+    for i, doc in enumerate(docs):
+        content, source, cursor = doc.page_content, _relative_source(folder_path, doc), 0
+        for text in splitter.split_text(content):
+            start = content.find(text, cursor)
+            if start < 0:
+                start = max(0, content.find(text))
+            chunks.append(Chunk(i, source, start, text))
+            cursor = start + 1
+    return chunks
+
+
+# --- Index et mesures ---
+def build_index(kind: str, vectors: np.ndarray) -> faiss.Index:
+    dim = vectors.shape[1]
+    if kind == "flat-l2":
+        index = faiss.IndexFlatL2(dim)
+    elif kind == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, HNSW_M)
+        index.hnsw.efSearch = HNSW_EF_SEARCH
+    elif kind == "sq8":
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit)
+        index.train(vectors)
+    else:
+        raise ValueError(f"Type d'index inconnu : {kind}")
+    index.add(vectors)
+    return index
+
+
+def _as_matrix(vectors: List[List[float]]) -> np.ndarray:
+    # vecteurs tels que renvoyés par l'embedder, sans normalisation (comme rag_system)
+    return np.asarray(vectors, dtype="float32")
+
+
+def token_counter() -> Tuple[str, Callable[[str], int]]:
+    """Tokens au sens du LLM (tiktoken) ; à défaut (hors ligne), ~4 caractères par token."""
+    try:
+        import tiktoken
+        encoding = tiktoken.encoding_for_model(LLM_MODEL)
+        return f"tiktoken/{encoding.name}", lambda text: len(encoding.encode(text))
+    except Exception as e:
+        print(f"[Warning] tiktoken indisponible ({type(e).__name__}), estimation len/4")
+        return "len/4", lambda text: (len(text) + 3) // 4
+
+
+def _score(labels: Sequence[Label], results: Sequence[Sequence[Chunk]], timings: List[float],
+           count_tokens: Callable[[str], int]) -> Dict[str, float]:
+    hits, reciprocal, tokens = 0, 0.0, 0
+    for label, found in zip(labels, results):
+        rank = next((r for r, chunk in enumerate(found, 1) if label.is_relevant(chunk)), None)
+        if rank is not None:
+            hits += 1
+            reciprocal += 1.0 / rank
+        # même mise en forme que rag_system.make_context
+        tokens += count_tokens("\n\n".join(f"[{c.source}]\n{c.text}" for c in found))
+    timings.sort()
+    n = len(labels)
+    return {
+        "recall": round(hits / n, 3),
+        "mrr": round(reciprocal / n, 3),
+        "context_tokens": round(tokens / n, 1),
+        "search_p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+        "search_p95_ms": round(percentile(timings, 0.95) * 1000, 3),
+    }
+
+
+def evaluate(index: faiss.Index, chunks: Sequence[Chunk], labels: Sequence[Label],
+             queries: np.ndarray, k: int, count_tokens: Callable[[str], int],
+             repeat: int) -> Dict[str, float]:
+    results, timings = [], []
+    for i in range(len(labels)):
+        query = queries[i:i + 1]
+        for _ in range(repeat):
+            started = time.perf_counter()
+            _, ids = index.search(query, k)
+            timings.append(time.perf_counter() - started)
+        results.append([chunks[j] for j in ids[0] if j >= 0])
+    return _score(labels, results, timings, count_tokens)
+
+
+class _QueryCache(Embeddings):
+    """Vectorise chaque question une seule fois : la latence mesurée est celle de la recherche."""
+
+    def __init__(self, embedder: Embeddings):
+        self.embedder = embedder
+        self._queries: Dict[str, List[float]] = {}
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embedder.embed_documents(texts)
+
+    def embed_query(self, text: str) -> List[float]:
+        if text not in self._queries:
+            self._queries[text] = self.embedder.embed_query(text)
+        return self._queries[text]
+
+
+def _locate(docs: Sequence[Document], doc_ids: Dict[str, int], source: str, text: str) -> Chunk:
+    """Retrouve un chunk renvoyé par ShardedRAG dans son document (position inconnue : -1)."""
+    doc = doc_ids.get(source, -1)
+    start = docs[doc].page_content.find(text) if doc >= 0 else -1
+    return Chunk(doc if start >= 0 else -1, source, start, text)
+
+
+def evaluate_node(rag: ShardedRAG, shards: Sequence[str], k: int, docs: Sequence[Document],
+                  labels: Sequence[Label], count_tokens: Callable[[str], int],
+                  repeat: int) -> Dict[str, float]:
+    """Comme evaluate, via ShardedRAG.retrieve (shards en parallèle, fusion des k meilleurs)."""
+    doc_ids = {doc.metadata.get("source", ""): i for i, doc in enumerate(docs)}
+    results, timings = [], []
+    for label in labels:
+        for _ in range(repeat):
+            started = time.perf_counter()
+            found = rag.retrieve(label.question, shards=shards, k=k, strict=True)
+            timings.append(time.perf_counter() - started)
+        results.append([_locate(docs, doc_ids, src, text) for src, text in found])
+    return _score(labels, results, timings, count_tokens)
+
+
+def pareto_front(rows: Sequence[Dict], objectives=PARETO_OBJECTIVES) -> List[Dict]:
+    """Configurations qu'aucune autre n'égale ou ne bat sur tous les critères."""
+    def dominates(a: Dict, b: Dict) -> bool:
+        at_least, better = True, False
+        for key, sign, tolerance in objectives:
+            margin = tolerance * max(abs(a[key]), abs(b[key]))
+            diff = sign * (a[key] - b[key])
+            at_least = at_least and diff >= -margin
+            better = better or diff > margin
+        return at_least and better
+    return [row for row in rows if not any(dominates(other, row) for other in rows)]
+
+
+def run_sweep(folder_path: Path, docs: Sequence[Document], labels: Sequence[Label],
+              embedder: Embeddings, chunk_sizes: Sequence[int], overlaps: Sequence[int],
+              ks: Sequence[int], index_types: Sequence[str], repeat: int,
+              count_tokens: Callable[[str], int]) -> List[Dict]:
+    queries = _as_matrix([embedder.embed_query(label.question) for label in labels])
+    rows = []
+    for chunk_size, overlap in itertools.product(chunk_sizes, overlaps):
+        if overlap >= chunk_size:
+            continue
+        chunks = split_corpus(folder_path, docs, chunk_size, overlap)
+        started = time.perf_counter()
+        vectors = _as_matrix(embedder.embed_documents([c.text for c in chunks]))
+        embed_s = time.perf_counter() - started
+        for kind in index_types:
+            started = time.perf_counter()
+            index = build_index(kind, vectors)
+            index_s = time.perf_counter() - started
+            index_bytes = int(faiss.serialize_index(index).nbytes)
+            for k in ks:
+                row = {"chunk_size": chunk_size, "chunk_overlap": overlap, "k": k, "index": kind,
+                       "chunks": len(chunks), "build_ms": round((embed_s + index_s) * 1000, 1),
+                       "index_bytes": index_bytes}
+                row.update(evaluate(index, chunks, labels, queries, k, count_tokens, repeat))
+                rows.append(row)
+    return rows
+
+
+def run_node_sweep(folder_path: Path, docs: Sequence[Document], labels: Sequence[Label],
+                   embedder: Embeddings, node: str, chunk_sizes: Sequence[int],
+                   overlaps: Sequence[int], ks: Sequence[int],
+                   shard_ks: Sequence[Optional[int]], repeat: int,
+                   count_tokens: Callable[[str], int]) -> List[Dict]:
+    shards = NODE_SHARDS[node][0]
+    embedder = _QueryCache(embedder)
+    for label in labels:
+        embedder.embed_query(label.question)
+    rows = []
+    for chunk_size, overlap in itertools.product(chunk_sizes, overlaps):
+        if overlap >= chunk_size:
+            continue
+        started = time.perf_counter()
+        # tous les shards : l'affectation des fichiers (shard_of) dépend de SHARDS entier
+        rag = ShardedRAG(str(folder_path), embeddings=embedder,
+                         chunk_size=chunk_size, chunk_overlap=overlap)
+        build_ms = round((time.perf_counter() - started) * 1000, 1)
+        targets = {name: rag.shards[name] for name in shards}
+        n_chunks = sum(shard.memory_footprint()["chunks"] for shard in targets.values())
+        index_bytes = sum(int(faiss.serialize_index(shard.vstore.index).nbytes)
+                          for shard in targets.values() if shard.vstore is not None)
+        for shard_k in shard_ks:
+            for name, shard in targets.items():
+                shard.k = shard_k or SHARDS[name].get("k", 4)
+            for k in ks:
+                row = {"node": node, "chunk_size": chunk_size, "chunk_overlap": overlap, "k": k,
+                       "shard_k": shard_k or "SHARDS", "index": "flat-l2", "chunks": n_chunks,
+                       "build_ms": build_ms, "index_bytes": index_bytes}
+                row.update(evaluate_node(rag, shards, k, docs, labels, count_tokens, repeat))
+                rows.append(row)
+    return rows
+
+
+def print_table(rows: Sequence[Dict], front: Sequence[Dict]):
+    on_front = {id(row) for row in front}
+    # avec --node, la colonne indique le k de chaque shard (l'index est toujours flat-l2)
+    by_node = any("shard_k" in r for r in rows)
+    column = "k shard" if by_node else "index"
+    print(f"{'':2}{'taille':>7}{'chev.':>6}{'k':>3} {column:<8}{'chunks':>7}{'recall':>8}{'MRR':>7}"
+          f"{'tokens':>8}{'p50 ms':>9}{'p95 ms':>9}{'index Ko':>10}{'constr. ms':>11}")
+    for r in rows:
+        mark = "* " if id(r) in on_front else "  "
+        setting = str(r["shard_k"] if by_node else r["index"])
+        print(f"{mark}{r['chunk_size']:>7}{r['chunk_overlap']:>6}{r['k']:>3} {setting:<8}{r['chunks']:>7}"
+              f"{r['recall']:>8.3f}{r['mrr']:>7.3f}{r['context_tokens']:>8.1f}{r['search_p50_ms']:>9.3f}"
+              f"{r['search_p95_ms']:>9.3f}{r['index_bytes'] / 1024:>10.1f}{r['build_ms']:>11.1f}")
+
+
+def _int_list(spec: str) -> List[int]:
+    return [int(v) for v in spec.split(",") if v.strip()]
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Évaluation de la recherche et balayage du découpage.")
+    parser.add_argument("--folder", type=Path, default=Path("donnees"), help="corpus (.txt/.pdf)")
+    scope = parser.add_mutually_exclusive_group()
+    scope.add_argument("--shard", choices=list(SHARDS), default=None,
+                       help="n'évalue que les fichiers d'une collection")
+    scope.add_argument("--node", choices=list(NODE_SHARDS), default=None,
+                       help="évalue les k d'un nœud via ShardedRAG, comme en production")
+    parser.add_argument("--questions", type=Path, default=None,
+                        help="questions étiquetées (JSONL) ; par défaut les Q/R du corpus")
+    parser.add_argument("--save-questions", type=Path, default=None,
+                        help="écrit le jeu de questions utilisé (JSONL)")
+    parser.add_argument("--chunk-sizes", default=DEFAULT_CHUNK_SIZES)
+    parser.add_argument("--overlaps", default=DEFAULT_OVERLAPS)
+    parser.add_argument("--ks", default=DEFAULT_KS)
+    parser.add_argument("--shard-ks", default="",
+                        help="k de chaque shard avec --node (par défaut ceux de SHARDS)")
+    parser.add_argument("--index-types", default=",".join(INDEX_TYPES))
+    parser.add_argument("--embedder", choices=["hashing", "openai"], default="hashing",
+                        help="embeddings locaux (hors ligne) ou OpenAI")
+    parser.add_argument("--repeat", type=int, default=5, help="recherches par question (latence)")
+    parser.add_argument("--all", action="store_true", help="affiche toutes les configurations")
+    parser.add_argument("--report", type=Path, default=None, help="rapport JSON")
+    return parser.parse_args(argv)
+
+
+def _shard_filter(folder_path: Path, shard: Optional[str]) -> Optional[FileFilter]:
+    if shard is None:
+        return None
+    return lambda p: shard_of(folder_path, p) == shard
+
+
+def _warn_if_undecided(rows: Sequence[Dict], n_questions: int):
+    quality = {(r["recall"], r["mrr"]) for r in rows}
+    if len(rows) > 1 and len(quality) == 1:
+        recall, mrr = quality.pop()
+        print(f"[Warning] toutes les configurations ont la même qualité (recall {recall:.3f}, "
+              f"MRR {mrr:.3f}) : le jeu de questions ne les départage pas, le front ne "
+              f"reflète que le coût. Compléter les questions (--save-questions puis --questions).")
+    elif n_questions < MIN_QUESTIONS:
+        print(f"[Warning] {n_questions} questions seulement : écarts de qualité peu significatifs.")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    with tempfile.TemporaryDirectory(prefix="eval_retrieval-") as workdir:
+        run(args, Path(workdir))
+
+
+def run(args: argparse.Namespace, workdir: Path):
+    folder = args.folder
+    docs = load_documents(folder, _shard_filter(folder, args.shard))
+    if not docs:
+        raise SystemExit(f"Aucun document dans {folder}")
+    items = load_questions(args.questions) if args.questions else faq_questions(folder, docs)
+    if args.save_questions is not None:
+        with args.save_questions.open("w", encoding="utf-8") as f:
+            for item in items:
+                f.write(json.dumps(item, ensure_ascii=False) + "\n")
+    if args.questions is None:
+        # questions tirées du corpus : retirées des documents évalués, sinon
+        # chaque configuration les retrouve mot pour mot
+        folder = without_questions(folder, workdir)
+        docs = load_documents(folder, _shard_filter(folder, args.shard))
+        print("Questions de la FAQ : lignes « Q : » retirées des documents évalués")
+    labels = resolve_labels(folder, docs, items)
+    if args.node is not None:
+        # une question dont la source n'est dans aucun shard du nœud ne peut être trouvée
+        node_shards = NODE_SHARDS[args.node][0]
+        labels = [label for label in labels
+                  if shard_of(folder, folder / label.source) in node_shards]
+    if not labels:
+        raise SystemExit("Aucune question étiquetée (voir --questions)")
+    index_types = [t for t in args.index_types.split(",") if t]
+    unknown = [t for t in index_types if t not in INDEX_TYPES]
+    if unknown:
+        raise SystemExit(f"Types d'index inconnus : {unknown} (choix : {', '.join(INDEX_TYPES)})")
+
+    if args.embedder == "openai":
+        from backends import make_embeddings
+        embedder = make_embeddings()
+    else:
+        embedder = HashingEmbeddings()
+    tokenizer, count_tokens = token_counter()
+    print(f"{len(docs)} documents, {len(labels)} questions, embeddings {args.embedder}, "
+          f"tokens {tokenizer}")
+
+    if args.node is not None:
+        shards, k = NODE_SHARDS[args.node]
+        shard_ks = ", ".join(f"{name}={SHARDS[name].get('k', 4)}" for name in shards)
+        print(f"Nœud {args.node} (production) : k = {k} après fusion, k par shard {shard_ks}")
+        rows = run_node_sweep(folder, docs, labels, embedder, args.node,
+                              _int_list(args.chunk_sizes), _int_list(args.overlaps),
+                              _int_list(args.ks), _int_list(args.shard_ks) or [None],
+                              max(1, args.repeat), count_tokens)
+    else:
+        rows = run_sweep(folder, docs, labels, embedder, _int_list(args.chunk_sizes),
+                         _int_list(args.overlaps), _int_list(args.ks), index_types,
+                         max(1, args.repeat), count_tokens)
+    front = pareto_front(rows)
+    front_ids = {id(row) for row in front}
+    for row in rows:
+        row["pareto"] = id(row) in front_ids
+    shown = rows if args.all else sorted(front, key=lambda r: (-r["recall"], -r["mrr"], r["context_tokens"]))
+    title = "Toutes les configurations (* : front de Pareto)" if args.all else "Front de Pareto"
+    print(f"\n=== {title} — qualité (recall, MRR) / coût (tokens, latence p50)")
+    print_table(shown, front)
+    _warn_if_undecided(rows, len(labels))
+    if args.report is not None:
+        args.report.write_text(json.dumps({"tokenizer": tokenizer, "embedder": args.embedder,
+                                           "node": args.node, "questions": len(labels),
+                                           "rows": rows},
+                                          ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
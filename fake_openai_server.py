@@ -0,0 +1,116 @@
+# fake_openai_server.py
+"""
+Serveur local compatible OpenAI (/v1/chat/completions, /v1/embeddings)
+qui injecte de la latence et des erreurs, pour tester délais, retries,
+hedging et disjoncteur sans appeler l'API réelle.
+
+    python fake_openai_server.py --port 8787 --latency-ms 300 --slow-ratio 0.1 --slow-ms 20000
+    OPENAI_BASE_URL=http://localhost:8787/v1 OPENAI_API_KEY=local streamlit run app.py
+
+Les réponses viennent des backends locaux de backends.py.
+"""
+
+import argparse
+import asyncio
+import base64
+import random
+import struct
+import time
+import uuid
+from types import SimpleNamespace
+
+from aiohttp import web
+
+from backends import FakeChatModel, HashingEmbeddings
+
+
+class LatencyInjector:
+    def __init__(self, latency_ms: float, jitter_ms: float, slow_ratio: float,
+                 slow_ms: float, error_ratio: float, seed: int = 0):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.slow_ratio = slow_ratio
+        self.slow_ms = slow_ms
+        self.error_ratio = error_ratio
+        self.rng = random.Random(seed)
+
+    async def __call__(self):
+        delay = self.latency_ms + self.rng.uniform(0, self.jitter_ms)
+        if self.rng.random() < self.slow_ratio:
+            delay = self.slow_ms
+        await asyncio.sleep(delay / 1000.0)
+        if self.rng.random() < self.error_ratio:
+            raise web.HTTPServiceUnavailable(
+                text='{"error": {"message": "injected failure", "type": "server_error"}}',
+                content_type="application/json")
+
+
+def create_app(injector: LatencyInjector) -> web.Application:
+    chat = FakeChatModel()
+    embedder = HashingEmbeddings(size=256)
+
+    async def chat_completions(request: web.Request) -> web.Response:
+        body = await request.json()
+        await injector()
+        messages = [SimpleNamespace(content=m.get("content") or "") for m in body.get("messages", [])]
+        content = chat.invoke(messages).content
+        return web.json_response({
+            "id": f"chatcmpl-{uuid.uuid4().hex}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": body.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        })
+
+    async def embeddings(request: web.Request) -> web.Response:
+        body = await request.json()
+        await injector()
+        inputs = body.get("input", [])
+        if isinstance(inputs, str) or (inputs and isinstance(inputs[0], int)):
+            inputs = [inputs]
+        # langchain envoie des IDs de tokens : même texte -> mêmes IDs -> même vecteur
+        texts = [t if isinstance(t, str) else " ".join(map(str, t)) for t in inputs]
+        vectors = embedder.embed_documents(texts)
+        as_base64 = body.get("encoding_format") == "base64"
+        data = [{
+            "object": "embedding",
+            "index": i,
+            "embedding": (base64.b64encode(struct.pack(f"<{len(v)}f", *v)).decode()
+                          if as_base64 else v),
+        } for i, v in enumerate(vectors)]
+        return web.json_response({
+            "object": "list",
+            "data": data,
+            "model": body.get("model", "fake"),
+            "usage": {"prompt_tokens": 0, "total_tokens": 0},
+        })
+
+    app = web.Application(client_max_size=16 * 1024 * 1024)
+    app.router.add_post("/v1/chat/completions", chat_completions)
+    app.router.add_post("/v1/embeddings", embeddings)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Stand-in OpenAI local avec latence injectée.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8787)
+    parser.add_argument("--latency-ms", type=float, default=200.0, help="latence de base")
+    parser.add_argument("--jitter-ms", type=float, default=100.0, help="jitter uniforme ajouté")
+    parser.add_argument("--slow-ratio", type=float, default=0.0, help="part des requêtes très lentes")
+    parser.add_argument("--slow-ms", type=float, default=20000.0, help="latence des requêtes lentes")
+    parser.add_argument("--error-ratio", type=float, default=0.0, help="part des réponses 503")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    injector = LatencyInjector(args.latency_ms, args.jitter_ms, args.slow_ratio,
+                               args.slow_ms, args.error_ratio, args.seed)
+    web.run_app(create_app(injector), host=args.host, port=args.port)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,412 @@
+# loadgen.py
+"""
+Générateur de charge : rejoue des conversations multi-tours (enregistrées
+ou synthétiques) contre le graphe en processus ou contre l'API HTTP, à un
+débit d'arrivée et une concurrence donnés, puis rapporte débit, latences
+par intention, taux d'erreurs/timeouts et attentes de verrou SQLite.
+
+    # graphe en processus, backends locaux à latence réaliste
+    python setup_db.py --db bench.sqlite --orders 100000
+    python loadgen.py --db bench.sqlite --conversations 200 --rate 4 --concurrency 32
+
+    # recherche du point de saturation d'un worker (un palier par débit)
+    python loadgen.py --db bench.sqlite --sweep 1,2,4,8,16 --conversations 100
+
+    # contre l'API HTTP (lancée à part : python server.py --fake)
+    python loadgen.py --target http --url http://localhost:8080 --rate 4
+
+Conversations enregistrées (--conversations-file) : JSONL, une conversation
+par ligne : {"flow": "support", "turns": ["Bonjour", "Comment ..."]}.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import sqlite3
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from resilience import percentile
+
+# Latences par défaut des backends locaux (voir backends.latency_distribution)
+DEFAULT_LLM_LATENCY = "lognormal:700:0.6"
+DEFAULT_EMBED_LATENCY = "lognormal:60:0.4"
+DEFAULT_MIX = {"salutation": 0.15, "support": 0.35, "vente": 0.25, "statut": 0.15, "commande": 0.10}
+
+_PRODUCTS = ["SSD 1To NVMe", "SSD 2To NVMe", "RAM 16 Go DDR4", "RAM 32 Go DDR4",
+             "PC Basic 8 Go", "Moniteur 27 pouces", "Clavier Mécanique", "Souris Gaming"]
+_SUPPORT_QUESTIONS = [
+    "Comment installer un SSD NVMe ?",
+    "Quelle est la durée de la garantie ?",
+    "Comment faire un retour produit ?",
+    "Mon PC ne démarre plus, comment accéder au BIOS ?",
+    "Comment installer la RAM dans le PC Basic 8 Go ?",
+]
+
+
+# --- Conversations ---
+def synthetic_conversation(flow: str, rng: random.Random, emails: Sequence[str],
+                           max_order_id: int) -> Dict[str, Any]:
+    product = rng.choice(_PRODUCTS)
+    email = rng.choice(emails) if emails else f"client.{rng.randint(1, 10_000)}@example.com"
+    if flow == "salutation":
+        turns = ["Bonjour", "Merci beaucoup !", "Au revoir"]
+    elif flow == "support":
+        turns = ["Bonjour", rng.choice(_SUPPORT_QUESTIONS), "Merci"]
+    elif flow == "vente":
+        turns = [f"Avez-vous des {product} disponibles ?",
+                 f"Quel est le prix du {product} ?"]
+    elif flow == "statut":
+        turns = [f"Quel est le statut de la commande {rng.randint(1, max_order_id)} ?",
+                 f"Où en sont mes commandes ? Mon email est {email}"]
+    elif flow == "commande":
+        turns = [f"Je cherche un {product}, il est disponible ?",
+                 f"Je veux commander 1 {product}, email {email}",
+                 "Merci"]
+    else:
+        raise ValueError(f"Flux inconnu : {flow}")
+    return {"flow": flow, "turns": turns}
+
+
+def load_conversations(path: Path) -> List[Dict[str, Any]]:
+    conversations = []
+    with path.open(encoding="utf-8") as f:
+        for lineno, line in enumerate(f, start=1):
+            if not line.strip():
+                continue
+            conv = json.loads(line)
+            if not isinstance(conv.get("turns"), list) or not conv["turns"]:
+                raise ValueError(f"{path}:{lineno} : 'turns' manquant")
+            conv.setdefault("flow", "enregistré")
+            conversations.append(conv)
+    return conversations
+
+
+def sample_emails(db_path: Optional[Path], n: int, rng: random.Random) -> Tuple[List[str], int]:
+    """Emails et ID max de commandes réels de la base, pour des recherches qui aboutissent."""
+    if db_path is None or not db_path.exists():
+        return [], 100
+    conn = sqlite3.connect(db_path)
+    try:
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM orders;").fetchone()[0]
+        if not max_id:
+            return [], 100
+        ids = [rng.randint(1, max_id) for _ in range(n)]
+        rows = conn.execute(
+            f"SELECT customer_email FROM orders WHERE id IN ({', '.join('?' * len(ids))});", ids)
+        return [r[0] for r in rows if r[0]], max_id
+    finally:
+        conn.close()
+
+
+def parse_mix(spec: str) -> Dict[str, float]:
+    mix = {}
+    for part in spec.split(","):
+        flow, _, weight = part.partition("=")
+        mix[flow.strip()] = float(weight)
+    return mix
+
+
+# --- Cibles ---
+class TurnResult:
+    __slots__ = ("flow", "intent", "outcome", "latency", "started")
+
+    def __init__(self, flow: str, intent: str, outcome: str, latency: float, started: float):
+        self.flow = flow
+        self.intent = intent
+        self.outcome = outcome  # ok | degraded | timeout | rejected | error
+        self.latency = latency
+        self.started = started
+
+
+def _outcome_from_trace(trace: Sequence[str]) -> str:
+    return "degraded" if any("amont dégradé" in t for t in trace) else "ok"
+
+
+class GraphTarget:
+    """Graphe en processus, un thread par tour (pool borné par la concurrence)."""
+
+    def __init__(self, concurrency: int, timeout: float, turn_budget: Optional[float],
+                 db_path: Path):
+        import tools
+        # les flux "commande" créent des commandes et décrémentent le stock :
+        # jamais dans la base de l'application
+        tools.DB_PATH = db_path
+        from agent_graph import GRAPH, get_rag
+        self.tools = tools
+        self.graph = GRAPH
+        self.timeout = timeout
+        self.turn_budget = turn_budget if turn_budget is not None else timeout
+        self.executor = ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix="loadgen")
+        get_rag()  # index construit avant la mesure
+
+    def new_session(self) -> Any:
+        return {"messages": []}
+
+    async def turn(self, session: Dict[str, Any], message: str) -> Tuple[Dict[str, Any], str, str]:
+        from server import finish_turn_state, prepare_turn_state
+        state = prepare_turn_state(session, message, self.turn_budget)
+        loop = asyncio.get_running_loop()
+        try:
+            new_state = await asyncio.wait_for(
+                loop.run_in_executor(self.executor, self.graph.invoke, state), self.timeout)
+        except asyncio.TimeoutError:
+            return session, "?", "timeout"
+        except Exception:
+            return session, "?", "error"
+        new_state = finish_turn_state(new_state)
+        return new_state, new_state.get("intent") or "?", _outcome_from_trace(new_state.get("trace", []))
+
+    async def db_stats(self) -> Dict[str, float]:
+        return self.tools.db_stats()
+
+    async def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+
+class HttpTarget:
+    """API HTTP de server.py (POST /chat, GET /metrics)."""
+
+    def __init__(self, url: str, timeout: float):
+        import aiohttp
+        self.url = url.rstrip("/")
+        self.timeout = timeout
+        self._aiohttp = aiohttp
+        self.session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=timeout),
+            connector=aiohttp.TCPConnector(limit=0))
+
+    def new_session(self) -> Any:
+        return uuid.uuid4().hex
+
+    async def turn(self, session: str, message: str) -> Tuple[str, str, str]:
+        try:
+            async with self.session.post(f"{self.url}/chat",
+                                         json={"session_id": session, "message": message}) as r:
+                if r.status == 503:
+                    return session, "?", "rejected"
+                if r.status == 504:
+                    return session, "?", "timeout"
+                if r.status != 200:
+                    return session, "?", "error"
+                body = await r.json()
+        except asyncio.TimeoutError:
+            return session, "?", "timeout"
+        except self._aiohttp.ClientError:
+            return session, "?", "error"
+        return session, body.get("intent") or "?", _outcome_from_trace(body.get("trace", []))
+
+    async def db_stats(self) -> Dict[str, float]:
+        try:
+            async with self.session.get(f"{self.url}/metrics") as r:
+                return (await r.json()).get("db", {}) if r.status == 200 else {}
+        except (asyncio.TimeoutError, self._aiohttp.ClientError):
+            return {}
+
+    async def close(self):
+        await self.session.close()
+
+
+# --- Exécution d'un palier ---
+async def run_stage(target, conversations: List[Dict[str, Any]], rate: float,
+                    concurrency: int, think_time: float, rng: random.Random) -> Dict[str, Any]:
+    """
+    Arrivées de Poisson à 'rate' conversations/s (0 : toutes d'un coup),
+    au plus 'concurrency' conversations en cours. Une arrivée qui trouve
+    toutes les places prises attend : ce retard est mesuré à part.
+    """
+    slots = asyncio.Semaphore(concurrency)
+    results: List[TurnResult] = []
+    arrival_delays: List[float] = []
+
+    async def conversation(conv: Dict[str, Any]):
+        try:
+            session = target.new_session()
+            for i, message in enumerate(conv["turns"]):
+                if i and think_time > 0:
+                    await asyncio.sleep(rng.expovariate(1.0 / think_time))
+                started = time.perf_counter()
+                session, intent, outcome = await target.turn(session, message)
+                results.append(TurnResult(conv["flow"], intent, outcome,
+                                          time.perf_counter() - started, started))
+        finally:
+            slots.release()
+
+    db_before = await target.db_stats()
+    start = time.perf_counter()
+    tasks = []
+    next_arrival = start
+    for conv in conversations:
+        if rate > 0:
+            next_arrival += rng.expovariate(rate)
+            await asyncio.sleep(max(0.0, next_arrival - time.perf_counter()))
+        scheduled = time.perf_counter()
+        await slots.acquire()
+        arrival_delays.append(time.perf_counter() - scheduled)
+        tasks.append(asyncio.create_task(conversation(conv)))
+    await asyncio.gather(*tasks)
+    duration = time.perf_counter() - start
+    db_after = await target.db_stats()
+    db = {k: db_after.get(k, 0) - db_before.get(k, 0) for k in db_after if k != "lock_wait_max_s"}
+    db["lock_wait_max_s"] = db_after.get("lock_wait_max_s", 0)
+    return summarize(results, duration, len(conversations), arrival_delays, db, rate)
+
+
+def _latency_stats(latencies: Sequence[float]) -> Dict[str, float]:
+    values = sorted(latencies)
+    stats = {"n": len(values)}
+    for name, p in (("p50", 0.50), ("p90", 0.90), ("p95", 0.95), ("p99", 0.99)):
+        stats[name] = round(percentile(values, p) * 1000, 1)
+    stats["max"] = round(values[-1] * 1000, 1) if values else 0.0
+    return stats
+
+
+def summarize(results: List[TurnResult], duration: float, n_conversations: int,
+              arrival_delays: List[float], db: Dict[str, float], rate: float) -> Dict[str, Any]:
+    outcomes: Dict[str, int] = {}
+    by_intent: Dict[str, List[float]] = {}
+    for r in results:
+        outcomes[r.outcome] = outcomes.get(r.outcome, 0) + 1
+        if r.outcome in ("ok", "degraded"):
+            by_intent.setdefault(r.intent, []).append(r.latency)
+    total = len(results) or 1
+    served = sum(1 for r in results if r.outcome in ("ok", "degraded"))
+    return {
+        "rate": rate,
+        "duration_s": round(duration, 2),
+        "conversations": n_conversations,
+        "turns": len(results),
+        "throughput_turns_s": round(len(results) / duration, 2) if duration else 0.0,
+        "throughput_conversations_s": round(n_conversations / duration, 2) if duration else 0.0,
+        # tours effectivement servis (hors timeouts, rejets et erreurs)
+        "goodput_turns_s": round(served / duration, 2) if duration else 0.0,
+        "outcomes": {k: round(v / total, 4) for k, v in sorted(outcomes.items())},
+        "latency_ms": _latency_stats([r.latency for r in results if r.outcome in ("ok", "degraded")]),
+        "latency_by_intent_ms": {k: _latency_stats(v) for k, v in sorted(by_intent.items())},
+        "arrival_delay_ms": _latency_stats(arrival_delays),
+        "sqlite": db,
+    }
+
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n=== Débit cible : {report['rate'] or 'max'} conv/s — "
+          f"{report['conversations']} conversations, {report['turns']} tours en {report['duration_s']} s")
+    print(f"Débit mesuré : {report['throughput_turns_s']} tours/s "
+          f"(dont servis : {report['goodput_turns_s']}), "
+          f"{report['throughput_conversations_s']} conversations/s")
+    print("Résultats : " + "  ".join(f"{k} {v * 100:.1f} %" for k, v in report["outcomes"].items()))
+    print(f"{'intention':<14}{'n':>6}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    rows = list(report["latency_by_intent_ms"].items()) + [("TOUS", report["latency_ms"])]
+    for intent, s in rows:
+        print(f"{intent:<14}{s['n']:>6}{s['p50']:>9}{s['p90']:>9}{s['p95']:>9}{s['p99']:>9}{s['max']:>9}")
+    delay = report["arrival_delay_ms"]
+    print(f"Retard à l'admission (concurrence client saturée) : p95 {delay['p95']} ms, max {delay['max']} ms")
+    db = report["sqlite"]
+    if db:
+        print(f"SQLite : {int(db.get('write_txns', 0))} transactions d'écriture, "
+              f"{int(db.get('lock_waits', 0))} attentes de verrou "
+              f"(total {db.get('lock_wait_s', 0) * 1000:.1f} ms, max {db.get('lock_wait_max_s', 0) * 1000:.1f} ms), "
+              f"{int(db.get('lock_errors', 0))} erreurs 'database is locked'")
+
+
+def print_sweep(reports: List[Dict[str, Any]]):
+    print("\n=== Paliers")
+    print(f"{'conv/s':>8}{'tours/s':>9}{'servis/s':>10}{'p50':>9}{'p95':>9}{'p99':>9}{'ok %':>8}{'timeout %':>11}{'rejet %':>9}")
+    for r in reports:
+        lat, out = r["latency_ms"], r["outcomes"]
+        print(f"{r['rate']:>8}{r['throughput_turns_s']:>9}{r['goodput_turns_s']:>10}{lat['p50']:>9}{lat['p95']:>9}{lat['p99']:>9}"
+              f"{out.get('ok', 0) * 100:>8.1f}{out.get('timeout', 0) * 100:>11.1f}"
+              f"{out.get('rejected', 0) * 100:>9.1f}")
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Rejeu de conversations et mesure de charge.")
+    parser.add_argument("--target", choices=["graph", "http"], default="graph")
+    parser.add_argument("--url", default="http://localhost:8080", help="API HTTP (--target http)")
+    parser.add_argument("--backend", choices=["fake", "openai"], default="fake",
+                        help="backends du graphe en processus (--target graph)")
+    parser.add_argument("--llm-latency",
+                        default=os.getenv("SUNUTECH_FAKE_LLM_LATENCY_MS", DEFAULT_LLM_LATENCY),
+                        help="distribution de latence du LLM local")
+    parser.add_argument("--embed-latency",
+                        default=os.getenv("SUNUTECH_FAKE_EMBED_LATENCY_MS", DEFAULT_EMBED_LATENCY),
+                        help="distribution de latence des embeddings locaux")
+    parser.add_argument("--db", type=Path, default=None,
+                        help="base SQLite de test, modifiée par les commandes rejouées "
+                             "(obligatoire avec --target graph ; emails/IDs réalistes)")
+    parser.add_argument("--conversations-file", type=Path, default=None)
+    parser.add_argument("--save-conversations", type=Path, default=None,
+                        help="écrit les conversations rejouées (JSONL)")
+    parser.add_argument("--conversations", type=int, default=100, help="conversations par palier")
+    parser.add_argument("--mix", default=",".join(f"{k}={v}" for k, v in DEFAULT_MIX.items()))
+    parser.add_argument("--rate", type=float, default=2.0, help="arrivées de conversations/s (0 : toutes)")
+    parser.add_argument("--sweep", default="", help="liste de débits, ex. 1,2,4,8")
+    parser.add_argument("--concurrency", type=int, default=32, help="conversations simultanées max")
+    parser.add_argument("--think-time", type=float, default=0.0, help="pause moyenne entre tours (s)")
+    parser.add_argument("--timeout", type=float, default=30.0, help="délai max d'un tour côté client (s)")
+    parser.add_argument("--turn-budget", type=float, default=None, help="budget du graphe (s)")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report", type=Path, default=None, help="rapport JSON")
+    args = parser.parse_args(argv)
+    if args.target == "graph":
+        if args.db is None:
+            parser.error("--db est obligatoire avec --target graph (base de test, "
+                         "ex. python setup_db.py --db bench.sqlite --orders 100000)")
+        if not args.db.exists():
+            parser.error(f"base introuvable : {args.db} (créez-la avec setup_db.py --db {args.db})")
+    return args
+
+
+async def main_async(args: argparse.Namespace):
+    rng = random.Random(args.seed)
+    if args.conversations_file is not None:
+        pool = load_conversations(args.conversations_file)
+    else:
+        emails, max_order_id = sample_emails(args.db, 200, rng)
+        mix = parse_mix(args.mix)
+        flows = rng.choices(list(mix), weights=list(mix.values()), k=args.conversations)
+        pool = [synthetic_conversation(f, rng, emails, max_order_id) for f in flows]
+    if args.save_conversations is not None:
+        with args.save_conversations.open("w", encoding="utf-8") as f:
+            for conv in pool:
+                f.write(json.dumps(conv, ensure_ascii=False) + "\n")
+
+    if args.target == "graph":
+        if args.backend == "fake":
+            os.environ["SUNUTECH_FAKE_BACKENDS"] = "1"
+            # les options priment : une variable restée dans le shell ne doit
+            # pas fausser silencieusement la latence simulée
+            os.environ["SUNUTECH_FAKE_LLM_LATENCY_MS"] = args.llm_latency
+            os.environ["SUNUTECH_FAKE_EMBED_LATENCY_MS"] = args.embed_latency
+        target = GraphTarget(args.concurrency, args.timeout, args.turn_budget, args.db)
+    else:
+        target = HttpTarget(args.url, args.timeout)
+
+    rates = [float(r) for r in args.sweep.split(",")] if args.sweep else [args.rate]
+    reports = []
+    try:
+        for rate in rates:
+            conversations = [pool[i % len(pool)] for i in range(args.conversations)]
+            report = await run_stage(target, conversations, rate, args.concurrency,
+                                     args.think_time, rng)
+            print_report(report)
+            reports.append(report)
+    finally:
+        await target.close()
+    if len(reports) > 1:
+        print_sweep(reports)
+    if args.report is not None:
+        args.report.write_text(json.dumps(reports, ensure_ascii=False, indent=2), encoding="utf-8")
+
+
+def main(argv=None):
+    asyncio.run(main_async(parse_args(argv)))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,54 +1,173 @@
 # rag_system.py
 
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
 from pathlib import Path
-from typing import List, Tuple
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
 
 from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_openai import OpenAIEmbeddings
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
 from langchain_community.vectorstores import FAISS
-from langchain_community.document_loaders import DirectoryLoader, TextLoader
-from langchain_community.document_loaders.pdf import PyPDFDirectoryLoader
+from langchain_community.document_loaders import TextLoader
+from langchain_community.document_loaders.pdf import PyPDFLoader
 
 from dotenv import load_dotenv
 
+from backends import make_embeddings, make_index_embeddings
+
 load_dotenv()
 
+# Intervalle minimal (s) entre deux vérifications du dossier pour le hot reload
+RELOAD_CHECK_INTERVAL = 5.0
+# Après un échec de reconstruction, attente doublée à chaque échec (s) :
+# l'empreinte du dossier reste « changée » et relancerait l'indexation à
+# chaque vérification
+RELOAD_BACKOFF_CAP = 300.0
+# Découpage des documents (caractères) ; voir eval_retrieval.py pour les régler
+CHUNK_SIZE = 800
+CHUNK_OVERLAP = 100
+
+# Collections documentaires (shards), chacune avec son propre index et son k.
+# Un fichier appartient au shard du sous-dossier qui porte son nom
+# (ex. donnees/faq/...) ou, à la racine, au premier shard dont un motif
+# correspond au nom du fichier ; sinon au shard DEFAULT_SHARD.
+SHARDS: Dict[str, dict] = {
+    "manuels": {"patterns": ["manuel_*"], "k": 3},
+    "faq": {"patterns": ["faq_*"], "k": 2},
+    "politiques": {"patterns": ["politique_*"], "k": 2},
+    "autres": {"patterns": [], "k": 2},
+}
+DEFAULT_SHARD = "autres"
+# Collections interrogées par chaque nœud du graphe (agent_graph) et nombre
+# de chunks gardés après fusion ; voir eval_retrieval.py --node pour les régler
+NODE_SHARDS: Dict[str, Tuple[List[str], int]] = {
+    "support": (["manuels", "faq", "autres"], 3),
+    "vente": (["faq", "politiques", "autres"], 3),
+    "commande": (["politiques", "faq"], 2),
+}
+
+Fingerprint = Tuple[Tuple[str, int, int], ...]
+FileFilter = Callable[[Path], bool]
+
+_search_pool = ThreadPoolExecutor(max_workers=8, thread_name_prefix="rag-shard")
+
+
+def corpus_files(folder_path: Path, include: Optional[FileFilter] = None) -> List[Path]:
+    """Fichiers .txt/.pdf du dossier (récursif), filtrés par 'include'."""
+    if not folder_path.is_dir():
+        return []
+    return sorted(
+        path for path in folder_path.rglob("*")
+        if path.suffix.lower() in (".txt", ".pdf") and path.is_file()
+        and (include is None or include(path))
+    )
+
+
+def corpus_fingerprint(folder_path: Path, include: Optional[FileFilter] = None) -> Fingerprint:
+    """Empreinte (chemin, taille, mtime) des .txt/.pdf d'un dossier."""
+    entries = []
+    for path in corpus_files(folder_path, include):
+        st = path.stat()
+        entries.append((str(path.relative_to(folder_path)), st.st_size, st.st_mtime_ns))
+    return tuple(entries)
+
+
+def load_documents(folder_path: Path, include: Optional[FileFilter] = None) -> List[Document]:
+    """Charge les .txt/.pdf du dossier (un Document par fichier texte ou page PDF)."""
+    docs = []
+    for path in corpus_files(folder_path, include):
+        is_pdf = path.suffix.lower() == ".pdf"
+        try:
+            loader = PyPDFLoader(str(path)) if is_pdf else TextLoader(str(path))
+            docs.extend(loader.load())
+        except Exception as e:
+            print(f"[Warning] erreur chargement {'PDF' if is_pdf else 'TXT'} {path} : {e}")
+    return docs
+
+
+def shard_of(folder_path: Path, path: Path, shards: Dict[str, dict] = SHARDS) -> str:
+    rel = path.relative_to(folder_path)
+    if len(rel.parts) > 1 and rel.parts[0] in shards:
+        return rel.parts[0]
+    for name, spec in shards.items():
+        if any(fnmatch(rel.name, pattern) for pattern in spec.get("patterns", [])):
+            return name
+    return DEFAULT_SHARD
+
+
+def process_memory() -> Optional[int]:
+    """RSS courant du processus en octets (None si indisponible)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import resource
+        import sys
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # pic (et non RSS courant) : Ko sous Linux, octets sous macOS
+        return peak if sys.platform == "darwin" else peak * 1024
+    except (ImportError, OSError):
+        return None
+
+
 class DirectoryRAG:
-    def __init__(self, folder_path: str, k: int = 4):
+    def __init__(self, folder_path: str, k: int = 4,
+                 auto_reload_interval: Optional[float] = None,
+                 include: Optional[FileFilter] = None, allow_empty: bool = False,
+                 embeddings: Optional[Embeddings] = None,
+                 chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 index_embeddings: Optional[Embeddings] = None):
         self.folder_path = Path(folder_path)
         self.k = k
-        self.embeddings = OpenAIEmbeddings(model="text-embedding-3-small")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        # sous-ensemble des fichiers du dossier indexés (shard)
+        self.include = include
+        # un shard sans document reste vide (et se remplira au hot reload)
+        self.allow_empty = allow_empty
+        # requêtes : client au délai court, protégé par resilience.Upstream ;
+        # construction de l'index : client au délai long, avec retries
+        self.embeddings = embeddings or make_embeddings()
+        if index_embeddings is None:
+            index_embeddings = embeddings or make_index_embeddings()
+        self.index_embeddings = index_embeddings
         self.vstore = None
+        self.fingerprint: Fingerprint = ()
+        self.auto_reload_interval = auto_reload_interval
+        self._last_check = time.monotonic()
+        self._reload_failures = 0
+        self._retry_at = 0.0
+        self._lock = threading.Lock()
+        self._n_chunks = 0
+        self._text_bytes = 0
         self._build_index()
 
     def _load_documents(self):
         if not self.folder_path.exists() or not self.folder_path.is_dir():
             raise FileNotFoundError(f"Dossier non trouvé : {self.folder_path}")
 
-        try:
-            pdf_loader = PyPDFDirectoryLoader(str(self.folder_path))
-            docs_pdf = pdf_loader.load()
-        except Exception as e:
-            print(f"[Warning] erreur chargement PDF : {e}")
-            docs_pdf = []
-
-        try:
-            txt_loader = DirectoryLoader(
-                str(self.folder_path), glob="**/*.txt", loader_cls=TextLoader)
-            docs_txt = txt_loader.load()
-        except Exception as e:
-            print(f"[Warning] erreur chargement TXT : {e}")
-            docs_txt = []
-
-        docs = docs_pdf + docs_txt
-        if not docs:
+        docs = load_documents(self.folder_path, self.include)
+        if not docs and not self.allow_empty:
             raise ValueError(f"Aucun document dans {self.folder_path}")
         return docs
 
     def _build_index(self):
+        fingerprint = corpus_fingerprint(self.folder_path, self.include)
         docs = self._load_documents()
+        if not docs:
+            self.vstore = None
+            self.fingerprint = fingerprint
+            self._n_chunks = self._text_bytes = 0
+            return
         splitter = RecursiveCharacterTextSplitter(
-            chunk_size=800, chunk_overlap=100)
+            chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
         texts: List[str] = []
         metadatas: List[dict] = []
         for doc in docs:
@@ -64,21 +183,224 @@ class DirectoryRAG:
                 meta.setdefault("source", meta.get("source", ""))
                 metadatas.append(meta)
         try:
-            self.vstore = FAISS.from_texts(
-                texts, self.embeddings, metadatas=metadatas)
+            vstore = FAISS.from_texts(
+                texts, self.index_embeddings, metadatas=metadatas)
         except Exception as e:
             raise RuntimeError(f"Erreur création index FAISS : {e}")
+        # remplacement atomique : les recherches en cours gardent l'ancien index
+        self.vstore = vstore
+        self.fingerprint = fingerprint
+        self._n_chunks = len(texts)
+        self._text_bytes = sum(len(t.encode("utf-8")) for t in texts)
+
+    def reload_if_changed(self) -> bool:
+        """
+        Reconstruit l'index si les fichiers du dossier ont changé depuis la
+        dernière construction. Retourne True si l'index a été reconstruit.
+        """
+        with self._lock:
+            return self._reload_locked()
+
+    def _reload_locked(self) -> bool:
+        self._last_check = time.monotonic()
+        if corpus_fingerprint(self.folder_path, self.include) == self.fingerprint:
+            return False
+        try:
+            self._build_index()
+        except Exception as e:
+            # on garde l'index courant plutôt que de casser le service
+            self._reload_failures += 1
+            delay = min(RELOAD_BACKOFF_CAP,
+                        RELOAD_CHECK_INTERVAL * 2 ** self._reload_failures)
+            self._retry_at = time.monotonic() + delay
+            print(f"[Warning] rechargement de l'index impossible : {e} "
+                  f"(nouvel essai dans {delay:.0f} s)")
+            return False
+        self._reload_failures = 0
+        self._retry_at = 0.0
+        print(f"[Info] index {self.folder_path} reconstruit ({self._n_chunks} chunks)")
+        return True
 
-    def retrieve(self, query: str) -> List[Tuple[str, str]]:
-        if self.vstore is None:
+    def _background_reload(self):
+        try:
+            self._reload_locked()
+        finally:
+            self._lock.release()
+
+    def _maybe_reload(self):
+        """
+        Lance la vérification (et la reconstruction éventuelle) dans un
+        thread : la requête qui la déclenche, comme les suivantes, est
+        servie par l'index courant jusqu'au remplacement.
+        """
+        if self.auto_reload_interval is None:
+            return
+        now = time.monotonic()
+        if now - self._last_check < self.auto_reload_interval or now < self._retry_at:
+            return
+        if not self._lock.acquire(blocking=False):  # rechargement déjà en cours
+            return
+        self._last_check = time.monotonic()
+        try:
+            threading.Thread(target=self._background_reload, daemon=True,
+                             name=f"rag-reload-{self.folder_path.name}").start()
+        except RuntimeError:
+            self._lock.release()
+            raise
+
+    def memory_footprint(self) -> Dict[str, int]:
+        """Estimation de la mémoire occupée par l'index (octets)."""
+        index = getattr(self.vstore, "index", None)
+        vectors = index.ntotal * index.d * 4 if index is not None else 0
+        return {
+            "chunks": self._n_chunks,
+            "vectors_bytes": vectors,
+            "texts_bytes": self._text_bytes,
+        }
+
+    def retrieve_with_scores(self, query: str, strict: bool = False,
+                             k: Optional[int] = None) -> List[Tuple[str, str, float]]:
+        """
+        Recherche les k chunks les plus proches : (source, texte, distance L2,
+        plus petite = plus proche). Par défaut une erreur (ex. API
+        d'embeddings) donne une liste vide ; avec 'strict', elle est propagée
+        pour que l'appelant applique sa propre politique.
+        """
+        try:
+            embedding = self.embeddings.embed_query(query)
+        except Exception as e:
+            if strict:
+                raise
+            print(f"[Warning] erreur embeddings : {e}")
+            return []
+        return self.retrieve_by_vector(embedding, strict, k)
+
+    def retrieve_by_vector(self, embedding: List[float], strict: bool = False,
+                           k: Optional[int] = None) -> List[Tuple[str, str, float]]:
+        """Comme retrieve_with_scores, pour une requête déjà vectorisée."""
+        self._maybe_reload()
+        vstore = self.vstore
+        if vstore is None:
+            if self.allow_empty:
+                return []
             raise RuntimeError("Index non initialisé.")
         try:
-            docs = self.vstore.similarity_search(query, k=self.k)
+            hits = vstore.similarity_search_with_score_by_vector(embedding, k=k or self.k)
         except Exception as e:
+            if strict:
+                raise
             print(f"[Warning] erreur similarity_search : {e}")
             return []
-        return [(d.metadata.get("source", ""), d.page_content) for d in docs]
+        return [(d.metadata.get("source", ""), d.page_content, float(score)) for d, score in hits]
+
+    def retrieve(self, query: str, strict: bool = False) -> List[Tuple[str, str]]:
+        return [(src, txt) for src, txt, _ in self.retrieve_with_scores(query, strict)]
+
+    def make_context(self, query: str, strict: bool = False) -> str:
+        hits = self.retrieve(query, strict=strict)
+        return "\n\n".join([f"[{src}]\n{txt}" for src, txt in hits])
+
+
+class ShardedRAG:
+    """
+    Un index par collection (voir SHARDS). Une recherche n'interroge que
+    les shards demandés, en parallèle, puis fusionne les résultats par
+    distance : son coût suit la taille des collections utiles, pas celle
+    de tout le corpus. Chaque shard se recharge indépendamment.
+    """
+
+    def __init__(self, folder_path: str, shards: Dict[str, dict] = SHARDS,
+                 auto_reload_interval: Optional[float] = None,
+                 embeddings: Optional[Embeddings] = None,
+                 chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP):
+        self.folder_path = Path(folder_path)
+        if not self.folder_path.is_dir():
+            raise FileNotFoundError(f"Dossier non trouvé : {self.folder_path}")
+        self.embeddings = embeddings or make_embeddings()
+        self.index_embeddings = embeddings or make_index_embeddings()
+        self.shards: Dict[str, DirectoryRAG] = {}
+        for name, spec in shards.items():
+            self.shards[name] = DirectoryRAG(
+                folder_path, k=spec.get("k", 4),
+                auto_reload_interval=auto_reload_interval,
+                include=lambda p, name=name: shard_of(self.folder_path, p, shards) == name,
+                allow_empty=True,
+                embeddings=self.embeddings,
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                index_embeddings=self.index_embeddings,
+            )
+        if not any(rag.vstore is not None for rag in self.shards.values()):
+            raise ValueError(f"Aucun document dans {self.folder_path}")
+
+    def retrieve(self, query: str, shards: Optional[Sequence[str]] = None,
+                 k: Optional[int] = None, strict: bool = False) -> List[Tuple[str, str]]:
+        """
+        Interroge 'shards' (tous par défaut), chacun avec son k, et garde
+        les 'k' meilleurs chunks toutes collections confondues. La requête
+        n'est vectorisée qu'une fois, quel que soit le nombre de shards.
+        """
+        names = list(shards) if shards is not None else list(self.shards)
+        unknown = [n for n in names if n not in self.shards]
+        if unknown:
+            raise KeyError(f"Shards inconnus : {unknown}")
+        targets = [self.shards[n] for n in names]
+        if all(rag.vstore is None for rag in targets):
+            for rag in targets:
+                rag._maybe_reload()  # un shard vide peut se remplir au hot reload
+            return []
+        try:
+            embedding = self.embeddings.embed_query(query)
+        except Exception as e:
+            if strict:
+                raise
+            print(f"[Warning] erreur embeddings : {e}")
+            return []
+        if len(targets) == 1:
+            hits = targets[0].retrieve_by_vector(embedding, strict)
+        else:
+            futures = [_search_pool.submit(rag.retrieve_by_vector, embedding, strict) for rag in targets]
+            hits = [hit for f in futures for hit in f.result()]
+        hits.sort(key=lambda h: h[2])
+        return [(src, txt) for src, txt, _ in hits[:k or len(hits)]]
 
-    def make_context(self, query: str) -> str:
-        hits = self.retrieve(query)
+    def make_context(self, query: str, shards: Optional[Sequence[str]] = None,
+                     k: Optional[int] = None, strict: bool = False) -> str:
+        hits = self.retrieve(query, shards, k, strict)
         return "\n\n".join([f"[{src}]\n{txt}" for src, txt in hits])
+
+    def memory_footprint(self) -> Dict[str, int]:
+        parts = [rag.memory_footprint() for rag in self.shards.values()]
+        return {key: sum(p[key] for p in parts) for key in ("chunks", "vectors_bytes", "texts_bytes")}
+
+
+# --- Index partagé par processus ---
+_shared: Dict[Tuple[str, str], ShardedRAG] = {}
+_shared_lock = threading.Lock()
+
+
+def get_shared_rag(folder_path: str, shards: Dict[str, dict] = SHARDS) -> ShardedRAG:
+    """
+    Retourne les index du dossier, construits une seule fois par processus
+    et partagés entre toutes les sessions. Un shard est reconstruit (sans
+    recréer le client d'embeddings) quand ses fichiers changent.
+    """
+    key = (str(Path(folder_path).resolve()), json.dumps(shards, sort_keys=True))
+    with _shared_lock:
+        rag = _shared.get(key)
+        if rag is None:
+            rag = ShardedRAG(folder_path, shards,
+                             auto_reload_interval=RELOAD_CHECK_INTERVAL)
+            _shared[key] = rag
+    return rag
+
+
+def shared_memory_report() -> Dict[str, Optional[int]]:
+    """Empreinte mémoire du processus et des index partagés (octets)."""
+    indexes = [rag.memory_footprint() for rag in list(_shared.values())]
+    return {
+        "process_rss_bytes": process_memory(),
+        "indexes": sum(len(rag.shards) for rag in list(_shared.values())),
+        "chunks": sum(i["chunks"] for i in indexes),
+        "index_bytes": sum(i["vectors_bytes"] + i["texts_bytes"] for i in indexes),
+    }
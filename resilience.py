@@ -0,0 +1,250 @@
+# resilience.py
+"""
+Budget de latence par tour et appels protégés vers l'amont (LLM,
+embeddings, outils) : délai par appel borné par le budget restant,
+nouvelles tentatives avec jitter, requête dupliquée (hedging) au-delà du
+p95 observé et disjoncteur par dépendance.
+"""
+
+import math
+import os
+import random
+import sqlite3
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Deque, Dict, Optional, Sequence
+
+# Budget total d'un tour (s), surchargeable par tour via state["turn_budget"]
+TURN_BUDGET = float(os.getenv("SUNUTECH_TURN_BUDGET_S", "30"))
+# Délais maximaux par appel (s), toujours bornés par le budget restant
+LLM_CALL_TIMEOUT = 15.0
+EMBED_CALL_TIMEOUT = 5.0
+TOOL_CALL_TIMEOUT = 5.0
+# Nouvelles tentatives : backoff exponentiel « full jitter »
+MAX_RETRIES = 2
+BACKOFF_BASE = 0.2
+BACKOFF_CAP = 2.0
+# Hedging : duplique une requête encore en cours après le p95 observé
+HEDGE_LLM = os.getenv("SUNUTECH_HEDGE_LLM", "").lower() in ("1", "true", "yes")
+HEDGE_MIN_SAMPLES = 20
+# Disjoncteur : ouvert après N échecs consécutifs, demi-ouvert après le délai
+BREAKER_FAILURES = 5
+BREAKER_RESET_TIMEOUT = 30.0
+# Réponses HTTP passagères : délai dépassé, limite de débit, erreur serveur
+TRANSIENT_STATUS = {408, 429}
+# Erreurs réseau des clients HTTP (openai, httpx, aiohttp), reconnues par
+# nom pour ne pas importer ces bibliothèques ici
+TRANSIENT_ERRORS = {"APIConnectionError", "TransportError", "ClientConnectionError"}
+
+_executor = ThreadPoolExecutor(max_workers=32, thread_name_prefix="upstream")
+
+
+class DeadlineExceeded(TimeoutError):
+    """Le budget du tour (ou le délai de l'appel) est épuisé."""
+
+
+class CircuitOpen(RuntimeError):
+    """La dépendance est jugée dégradée : appel refusé sans être tenté."""
+
+
+def new_deadline(budget: float = TURN_BUDGET) -> float:
+    """Échéance absolue (epoch) : reste valable si l'état change de thread/processus."""
+    return time.time() + budget
+
+
+def remaining(deadline: Optional[float]) -> float:
+    if deadline is None:
+        return float("inf")
+    return deadline - time.time()
+
+
+def is_transient(exc: BaseException) -> bool:
+    """Erreur qu'une nouvelle tentative peut corriger : délai, réseau, 429, 5xx.
+
+    Les autres (arguments invalides, 400, erreur de programmation...)
+    échoueraient à l'identique et ne disent rien de la santé de l'amont.
+    """
+    if isinstance(exc, (TimeoutError, ConnectionError)):
+        return True
+    if isinstance(exc, sqlite3.OperationalError):
+        return "locked" in str(exc)
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if isinstance(status, int):
+        return status in TRANSIENT_STATUS or status >= 500
+    return any(cls.__name__ in TRANSIENT_ERRORS for cls in type(exc).__mro__)
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failures: int = BREAKER_FAILURES,
+                 reset_timeout: float = BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failures = failures
+        self.reset_timeout = reset_timeout
+        self._consecutive = 0
+        self._opened_at: Optional[float] = None
+        self._probe = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        if self._opened_at is None:
+            return "closed"
+        if time.monotonic() - self._opened_at >= self.reset_timeout:
+            return "half_open"
+        return "open"
+
+    def allow(self) -> bool:
+        """En demi-ouvert, un seul appel d'essai passe à la fois."""
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and not self._probe:
+                self._probe = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self._consecutive = 0
+            self._opened_at = None
+            self._probe = False
+
+    def record_failure(self):
+        with self._lock:
+            self._consecutive += 1
+            if self._probe or self._consecutive >= self.failures:
+                self._opened_at = time.monotonic()
+            self._probe = False
+
+    def release(self):
+        """Issue neutre (ni succès ni échec) : libère l'appel d'essai éventuel."""
+        with self._lock:
+            self._probe = False
+
+
+def percentile(sorted_values: Sequence[float], p: float) -> float:
+    """Percentile au rang le plus proche : plus petite valeur couvrant p des échantillons."""
+    if not sorted_values:
+        return 0.0
+    # tolérance : p * n flottant (0.95 * 20 = 19.000000000000004) ne doit pas sauter un rang
+    rank = math.ceil(p * len(sorted_values) - 1e-9)
+    return sorted_values[min(len(sorted_values), max(1, rank)) - 1]
+
+
+class LatencyTracker:
+    """Fenêtre glissante des latences réussies, pour le seuil de hedging."""
+
+    def __init__(self, size: int = 200):
+        self._samples: Deque[float] = deque(maxlen=size)
+
+    def add(self, seconds: float):
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> Optional[float]:
+        samples = sorted(self._samples)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return percentile(samples, p)
+
+
+class Upstream:
+    """
+    Une dépendance appelée de façon protégée. 'call' applique, dans
+    l'ordre : disjoncteur, délai min(timeout, budget restant), hedging
+    (si activé et l'appel idempotent), puis nouvelles tentatives.
+    """
+
+    def __init__(self, name: str, timeout: float, retries: int = MAX_RETRIES,
+                 hedge: bool = False):
+        self.name = name
+        self.timeout = timeout
+        self.retries = retries
+        self.hedge = hedge
+        self.breaker = CircuitBreaker(name)
+        self.latency = LatencyTracker()
+
+    def _attempt(self, fn: Callable[[], Any], timeout: float, hedge: bool) -> Any:
+        started = time.monotonic()
+        futures = [_executor.submit(fn)]
+        hedge_after = self.latency.percentile(0.95) if hedge else None
+        if hedge_after is not None and hedge_after < timeout:
+            done, _ = wait(futures, timeout=hedge_after)
+            if not done:
+                futures.append(_executor.submit(fn))
+        error: Optional[BaseException] = None
+        pending = set(futures)
+        while pending:
+            left = timeout - (time.monotonic() - started)
+            if left <= 0:
+                break
+            done, pending = wait(pending, timeout=left, return_when=FIRST_COMPLETED)
+            for f in done:
+                if f.exception() is None:
+                    for other in pending:
+                        other.cancel()
+                    self.latency.add(time.monotonic() - started)
+                    return f.result()
+                error = f.exception()
+        if error is not None and not pending:
+            raise error
+        # les threads en retard se terminent seuls (délai côté client HTTP)
+        raise DeadlineExceeded(f"{self.name} : pas de réponse en {timeout:.1f} s")
+
+    @staticmethod
+    def _backoff(attempt: int, deadline: Optional[float]) -> bool:
+        """Pause avant une nouvelle tentative ; False si le budget n'y suffit pas."""
+        pause = random.uniform(0, min(BACKOFF_CAP, BACKOFF_BASE * 2 ** attempt))
+        if pause >= remaining(deadline):
+            return False
+        time.sleep(pause)
+        return True
+
+    def call(self, fn: Callable[[], Any], deadline: Optional[float] = None,
+             idempotent: bool = True) -> Any:
+        retries = self.retries if idempotent else 0
+        for attempt in range(retries + 1):
+            # budget vérifié avant allow() : un appel jamais tenté ne doit
+            # pas garder l'appel d'essai du demi-ouvert
+            left = remaining(deadline)
+            if left <= 0:
+                raise DeadlineExceeded(f"{self.name} : budget du tour épuisé")
+            if not self.breaker.allow():
+                raise CircuitOpen(f"{self.name} indisponible (disjoncteur ouvert)")
+            timeout = min(self.timeout, left)
+            try:
+                result = self._attempt(fn, timeout, self.hedge and idempotent)
+            except Exception as e:
+                if isinstance(e, DeadlineExceeded) and timeout < self.timeout:
+                    # délai tronqué par le budget du tour : c'est le tour qui
+                    # manque de temps, pas la dépendance qui est défaillante
+                    self.breaker.release()
+                    raise
+                if not is_transient(e):
+                    # rejouer donnerait la même erreur : ni retry ni échec compté
+                    self.breaker.release()
+                    raise
+                self.breaker.record_failure()
+                if attempt == retries or not self._backoff(attempt, deadline):
+                    raise
+            except BaseException:  # KeyboardInterrupt... : pas un verdict sur la dépendance
+                self.breaker.release()
+                raise
+            else:
+                self.breaker.record_success()
+                return result
+
+
+UPSTREAMS: Dict[str, Upstream] = {
+    "llm": Upstream("llm", LLM_CALL_TIMEOUT, hedge=HEDGE_LLM),
+    "embeddings": Upstream("embeddings", EMBED_CALL_TIMEOUT),
+    "tools": Upstream("tools", TOOL_CALL_TIMEOUT),
+}
+
+
+def breaker_states() -> Dict[str, str]:
+    return {name: up.breaker.state for name, up in UPSTREAMS.items()}
@@ -0,0 +1,423 @@
+# server.py
+"""
+API HTTP asynchrone (aiohttp) exposant le graphe d'agents, sans Streamlit.
+
+    python server.py --port 8080            # backends OpenAI
+    python server.py --port 8080 --fake     # backends locaux (tests)
+
+Endpoints :
+    POST   /chat               {"session_id"?: str, "message": str}
+    POST   /chat/stream        idem, réponse en Server-Sent Events
+    DELETE /sessions/{id}      réinitialise une conversation
+    GET    /healthz            le processus répond
+    GET    /readyz             index chargé, pas d'arrêt en cours, file non saturée
+    GET    /metrics            file, disjoncteurs, attentes de verrou SQLite
+
+Identité : avec --identity-header (ex. X-Authenticated-Email), l'email du
+client est lu dans cet en-tête et permet de lister ses commandes. À
+n'activer que derrière un proxy qui authentifie l'utilisateur et écrase
+l'en-tête ; sinon, aucune recherche de commandes par email n'est servie.
+
+Le graphe (synchrone) tourne dans un pool de threads borné par
+--max-concurrency. Au-delà, les requêtes attendent dans une file bornée
+(--max-queue) pendant au plus --queue-timeout secondes, sinon 503 avec
+Retry-After. Une requête qui dépasse --request-timeout reçoit 504.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from aiohttp import web
+from langchain_core.messages import AIMessage, HumanMessage
+
+DEFAULT_MAX_CONCURRENCY = 4
+DEFAULT_MAX_QUEUE = 32
+DEFAULT_QUEUE_TIMEOUT = 5.0
+DEFAULT_REQUEST_TIMEOUT = 60.0
+DEFAULT_SHUTDOWN_GRACE = 30.0
+SESSION_TTL = 30 * 60
+MAX_SESSIONS = 10_000
+MAX_MESSAGE_CHARS = 4000
+# marge (s) entre le budget du graphe et le délai HTTP
+TURN_BUDGET_MARGIN = 1.0
+
+
+class Overloaded(Exception):
+    """La requête n'a pas pu obtenir de slot d'exécution à temps."""
+
+
+class AdmissionGate:
+    """
+    Limite le nombre de tours exécutés en parallèle et la taille de la file
+    d'attente. Un slot n'est rendu que lorsque le thread a réellement fini,
+    même si le client a déjà reçu un 504 : la limite reste donc vraie.
+    """
+
+    def __init__(self, max_concurrency: int, max_queue: int, queue_timeout: float):
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._sem = asyncio.Semaphore(max_concurrency)
+        self.waiting = 0
+        self.running = 0
+
+    @property
+    def saturated(self) -> bool:
+        return self.waiting >= self.max_queue
+
+    async def acquire(self):
+        if self.saturated:
+            raise Overloaded("file d'attente pleine")
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._sem.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            raise Overloaded("délai d'attente dépassé")
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._sem.release()
+
+
+class SessionStore:
+    """États de conversation en mémoire (LRU + expiration), un verrou par session."""
+
+    def __init__(self, ttl: float = SESSION_TTL, max_sessions: int = MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._items: "OrderedDict[str, Tuple[float, Dict[str, Any], asyncio.Lock]]" = OrderedDict()
+
+    def _evict(self):
+        now = time.monotonic()
+        while self._items:
+            sid, (seen, _, lock) = next(iter(self._items.items()))
+            expired = now - seen > self.ttl
+            if not expired and len(self._items) <= self.max_sessions:
+                break
+            if lock.locked() and not expired:
+                break
+            del self._items[sid]
+
+    def get(self, session_id: str) -> Tuple[Dict[str, Any], asyncio.Lock]:
+        item = self._items.pop(session_id, None)
+        state, lock = (item[1], item[2]) if item else ({"messages": []}, asyncio.Lock())
+        self._items[session_id] = (time.monotonic(), state, lock)
+        self._evict()
+        return state, lock
+
+    def put(self, session_id: str, state: Dict[str, Any]):
+        if session_id in self._items:
+            _, _, lock = self._items[session_id]
+            self._items[session_id] = (time.monotonic(), state, lock)
+
+    def delete(self, session_id: str) -> bool:
+        return self._items.pop(session_id, None) is not None
+
+    def __len__(self):
+        return len(self._items)
+
+
+def _json_error(status: int, message: str, **headers) -> web.Response:
+    return web.json_response({"error": message}, status=status, headers=headers or None)
+
+
+async def _read_turn(request: web.Request) -> Tuple[str, str]:
+    try:
+        body = await request.json()
+    except Exception:
+        raise web.HTTPBadRequest(text=json.dumps({"error": "JSON invalide"}),
+                                 content_type="application/json")
+    message = body.get("message") if isinstance(body, dict) else None
+    if not isinstance(message, str) or not message.strip():
+        raise web.HTTPBadRequest(text=json.dumps({"error": "'message' manquant"}),
+                                 content_type="application/json")
+    if len(message) > MAX_MESSAGE_CHARS:
+        raise web.HTTPRequestEntityTooLarge(MAX_MESSAGE_CHARS, len(message))
+    session_id = body.get("session_id") or uuid.uuid4().hex
+    return str(session_id), message.strip()
+
+
+def prepare_turn_state(state: Dict[str, Any], message: str, budget: float,
+                       customer_email: Optional[str] = None) -> Dict[str, Any]:
+    state = dict(state)
+    state["messages"] = list(state.get("messages", [])) + [HumanMessage(content=message)]
+    state["user_query"] = message
+    # identité vérifiée par l'hôte, reprise à chaque tour (jamais héritée)
+    if customer_email:
+        state["customer_email"] = customer_email
+    else:
+        state.pop("customer_email", None)
+    # le graphe se replie (cache / escalade) avant que le client ne reçoive 504
+    state["turn_budget"] = budget
+    # la trace et la réponse décrivent le tour courant uniquement
+    state["trace"] = []
+    state.pop("answer", None)
+    return state
+
+
+def finish_turn_state(new_state: Dict[str, Any]) -> Dict[str, Any]:
+    answer = new_state.get("answer")
+    if answer:
+        new_state["messages"] = list(new_state.get("messages", [])) + [AIMessage(content=answer)]
+    return new_state
+
+
+class ChatService:
+    def __init__(self, graph, warmup: Optional[Callable[[], Any]] = None,
+                 max_concurrency: int = DEFAULT_MAX_CONCURRENCY,
+                 max_queue: int = DEFAULT_MAX_QUEUE,
+                 queue_timeout: float = DEFAULT_QUEUE_TIMEOUT,
+                 request_timeout: float = DEFAULT_REQUEST_TIMEOUT,
+                 shutdown_grace: float = DEFAULT_SHUTDOWN_GRACE,
+                 identity_header: Optional[str] = None):
+        self.graph = graph
+        self.warmup = warmup
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.request_timeout = request_timeout
+        self.shutdown_grace = shutdown_grace
+        self.identity_header = identity_header
+        self.turn_budget = max(0.1, request_timeout - TURN_BUDGET_MARGIN)
+        self.sessions = SessionStore()
+        self.executor = ThreadPoolExecutor(max_workers=max_concurrency,
+                                           thread_name_prefix="graph")
+        self.gate: Optional[AdmissionGate] = None
+        self.ready = False
+        self.draining = False
+        self._warmup_task: Optional[asyncio.Task] = None
+
+    # --- cycle de vie ---
+    async def on_startup(self, app: web.Application):
+        # créé ici pour appartenir à la boucle du serveur
+        self.gate = AdmissionGate(self.max_concurrency, self.max_queue, self.queue_timeout)
+        self._warmup_task = asyncio.create_task(self._warm())
+
+    async def _warm(self):
+        try:
+            if self.warmup is not None:
+                await asyncio.get_running_loop().run_in_executor(self.executor, self.warmup)
+            self.ready = True
+        except Exception as e:
+            print(f"[Warning] préchargement impossible : {e}")
+
+    async def on_shutdown(self, app: web.Application):
+        """Refuse les nouvelles requêtes puis attend la fin des tours en cours."""
+        self.draining = True
+        deadline = time.monotonic() + self.shutdown_grace
+        while self.gate and (self.gate.running or self.gate.waiting) and time.monotonic() < deadline:
+            await asyncio.sleep(0.05)
+
+    async def on_cleanup(self, app: web.Application):
+        if self._warmup_task is not None:
+            self._warmup_task.cancel()
+        self.executor.shutdown(wait=False, cancel_futures=True)
+
+    # --- exécution d'un tour ---
+    async def _run(self, fn: Callable[[], Any]) -> Any:
+        """Exécute 'fn' dans le pool en respectant la file et les délais."""
+        await self.gate.acquire()
+        future = asyncio.get_running_loop().run_in_executor(self.executor, fn)
+        future.add_done_callback(lambda _: self.gate.release())
+        return await asyncio.wait_for(asyncio.shield(future), self.request_timeout)
+
+    def _customer_email(self, request: web.Request) -> Optional[str]:
+        if not self.identity_header:
+            return None
+        return request.headers.get(self.identity_header, "").strip() or None
+
+    def _admission_error(self) -> Optional[web.Response]:
+        if self.draining:
+            return _json_error(503, "arrêt en cours", **{"Retry-After": "1"})
+        if not self.ready:
+            return _json_error(503, "service en cours de démarrage", **{"Retry-After": "1"})
+        return None
+
+    async def chat(self, request: web.Request) -> web.Response:
+        if (err := self._admission_error()) is not None:
+            return err
+        session_id, message = await _read_turn(request)
+        state, lock = self.sessions.get(session_id)
+        async with lock:
+            state, _ = self.sessions.get(session_id)
+            turn = prepare_turn_state(state, message, self.turn_budget,
+                                      self._customer_email(request))
+            started = time.perf_counter()
+            try:
+                new_state = finish_turn_state(await self._run(lambda: self.graph.invoke(turn)))
+            except Overloaded as e:
+                return _json_error(503, f"service saturé : {e}", **{"Retry-After": "1"})
+            except asyncio.TimeoutError:
+                return _json_error(504, "délai de traitement dépassé")
+            except Exception as e:
+                return _json_error(500, f"erreur pendant l'inférence : {e}")
+            self.sessions.put(session_id, new_state)
+        return web.json_response({
+            "session_id": session_id,
+            "answer": new_state.get("answer", ""),
+            "intent": new_state.get("intent"),
+            "trace": new_state.get("trace", []),
+            "latency_ms": round((time.perf_counter() - started) * 1000, 1),
+        })
+
+    async def chat_stream(self, request: web.Request) -> web.StreamResponse:
+        """Même tour que /chat, avec un évènement SSE par nœud du graphe."""
+        if (err := self._admission_error()) is not None:
+            return err
+        session_id, message = await _read_turn(request)
+        loop = asyncio.get_running_loop()
+        events: asyncio.Queue = asyncio.Queue()
+
+        def produce(turn: Dict[str, Any]) -> Dict[str, Any]:
+            final = turn
+            for mode, chunk in self.graph.stream(turn, stream_mode=["updates", "values"]):
+                if mode == "values":
+                    final = chunk
+                else:
+                    for node in chunk:
+                        loop.call_soon_threadsafe(events.put_nowait, ("node", {"node": node}))
+            return final
+
+        state, lock = self.sessions.get(session_id)
+        async with lock:
+            state, _ = self.sessions.get(session_id)
+            turn = prepare_turn_state(state, message, self.turn_budget,
+                                      self._customer_email(request))
+            try:
+                await self.gate.acquire()
+            except Overloaded as e:
+                return _json_error(503, f"service saturé : {e}", **{"Retry-After": "1"})
+            future = loop.run_in_executor(self.executor, produce, turn)
+            future.add_done_callback(lambda _: self.gate.release())
+            future.add_done_callback(lambda _: loop.call_soon_threadsafe(events.put_nowait, None))
+
+            resp = web.StreamResponse(headers={
+                "Content-Type": "text/event-stream",
+                "Cache-Control": "no-cache",
+                "X-Accel-Buffering": "no",
+            })
+            await resp.prepare(request)
+
+            async def send(event: str, data: Dict[str, Any]):
+                payload = json.dumps(data, ensure_ascii=False)
+                await resp.write(f"event: {event}\ndata: {payload}\n\n".encode("utf-8"))
+
+            await send("session", {"session_id": session_id})
+            deadline = loop.time() + self.request_timeout
+            try:
+                while True:
+                    item = await asyncio.wait_for(events.get(), max(0.0, deadline - loop.time()))
+                    if item is None:
+                        break
+                    await send(*item)
+                new_state = finish_turn_state(future.result())
+                self.sessions.put(session_id, new_state)
+                await send("answer", {
+                    "answer": new_state.get("answer", ""),
+                    "intent": new_state.get("intent"),
+                    "trace": new_state.get("trace", []),
+                })
+            except asyncio.TimeoutError:
+                await send("error", {"error": "délai de traitement dépassé"})
+            except Exception as e:
+                await send("error", {"error": f"erreur pendant l'inférence : {e}"})
+            await resp.write_eof()
+            return resp
+
+    async def reset_session(self, request: web.Request) -> web.Response:
+        deleted = self.sessions.delete(request.match_info["session_id"])
+        return web.json_response({"deleted": deleted})
+
+    async def metrics(self, request: web.Request) -> web.Response:
+        from resilience import breaker_states
+        from tools import db_stats
+        return web.json_response({
+            "running": self.gate.running if self.gate else 0,
+            "waiting": self.gate.waiting if self.gate else 0,
+            "sessions": len(self.sessions),
+            "breakers": breaker_states(),
+            "db": db_stats(),
+        })
+
+    async def healthz(self, request: web.Request) -> web.Response:
+        return web.json_response({"status": "ok"})
+
+    async def readyz(self, request: web.Request) -> web.Response:
+        ok = self.ready and not self.draining and not (self.gate and self.gate.saturated)
+        body = {
+            "ready": ok,
+            "draining": self.draining,
+            "running": self.gate.running if self.gate else 0,
+            "waiting": self.gate.waiting if self.gate else 0,
+            "sessions": len(self.sessions),
+        }
+        return web.json_response(body, status=200 if ok else 503)
+
+
+def create_app(graph=None, warmup: Optional[Callable[[], Any]] = None, **options) -> web.Application:
+    """
+    Construit l'application. Sans 'graph', utilise agent_graph.GRAPH et
+    précharge l'index RAG partagé avant de se déclarer prêt.
+    """
+    if graph is None:
+        from agent_graph import GRAPH, get_rag
+        graph, warmup = GRAPH, warmup or get_rag
+    service = ChatService(graph, warmup=warmup, **options)
+    app = web.Application(client_max_size=64 * 1024)
+    app["service"] = service
+    app.on_startup.append(service.on_startup)
+    app.on_shutdown.append(service.on_shutdown)
+    app.on_cleanup.append(service.on_cleanup)
+    app.router.add_post("/chat", service.chat)
+    app.router.add_post("/chat/stream", service.chat_stream)
+    app.router.add_delete("/sessions/{session_id}", service.reset_session)
+    app.router.add_get("/healthz", service.healthz)
+    app.router.add_get("/readyz", service.readyz)
+    app.router.add_get("/metrics", service.metrics)
+    return app
+
+
+def parse_args(argv=None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="API HTTP du chatbot SunuTech.")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--fake", action="store_true",
+                        help="backends LLM/embeddings locaux (SUNUTECH_FAKE_BACKENDS=1)")
+    parser.add_argument("--max-concurrency", type=int, default=DEFAULT_MAX_CONCURRENCY)
+    parser.add_argument("--max-queue", type=int, default=DEFAULT_MAX_QUEUE)
+    parser.add_argument("--queue-timeout", type=float, default=DEFAULT_QUEUE_TIMEOUT)
+    parser.add_argument("--request-timeout", type=float, default=DEFAULT_REQUEST_TIMEOUT)
+    parser.add_argument("--shutdown-grace", type=float, default=DEFAULT_SHUTDOWN_GRACE)
+    parser.add_argument("--identity-header", default=os.getenv("SUNUTECH_IDENTITY_HEADER"),
+                        help="en-tête portant l'email du client authentifié (posé par le proxy)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.fake:
+        os.environ["SUNUTECH_FAKE_BACKENDS"] = "1"
+    app = create_app(
+        max_concurrency=args.max_concurrency,
+        max_queue=args.max_queue,
+        queue_timeout=args.queue_timeout,
+        request_timeout=args.request_timeout,
+        shutdown_grace=args.shutdown_grace,
+        identity_header=args.identity_header,
+    )
+    # SIGINT/SIGTERM : on_shutdown draine les tours en cours avant l'arrêt
+    web.run_app(app, host=args.host, port=args.port,
+                shutdown_timeout=args.shutdown_grace + 5)
+
+
+if __name__ == "__main__":
+    main()
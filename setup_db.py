@@ -1,7 +1,14 @@
 # setup_db.py
 
+import argparse
+import csv
+import json
+import random
 import sqlite3
+import time
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator, List, Optional, Sequence, Tuple
 
 DB_PATH = Path("sunutech_db.sqlite")
 
@@ -57,33 +64,303 @@ def create_tables(conn: sqlite3.Connection):
     """)
     conn.commit()
 
+SEED_PRODUCTS = [
+    ("PC Basic 8 Go", "Ordinateur de bureau simple, 8 Go RAM", 250.0, 15),
+    ("PC Gamer RTX", "PC gamer avec carte graphique RTX 4070", 1200.0, 5),
+    ("Serveur Entry", "Serveur d'entrée 4 cœurs, 16 Go RAM", 800.0, 3),
+    ("SSD 1To NVMe", "Disque SSD NVMe 1 To haute vitesse", 100.0, 20),
+    ("SSD 2To NVMe", "Disque SSD NVMe 2 To", 180.0, 10),
+    ("RAM 16 Go DDR4", "Barrette mémoire 16 Go DDR4", 60.0, 25),
+    ("RAM 32 Go DDR4", "Barrette mémoire 32 Go DDR4", 110.0, 10),
+    ("Moniteur 27\" 144Hz", "Moniteur 27 pouces, rafraîchissement 144 Hz", 300.0, 8),
+    ("Clavier Mécanique", "Clavier mécanique RGB", 80.0, 30),
+    ("Souris Gaming", "Souris gaming haute précision", 70.0, 30),
+]
+
+# Index secondaires utilisés par les outils (recherche des lignes d'une
+# commande, commandes d'un client, tri du catalogue par nom).
+INDEXES = {
+    "idx_order_items_order_id": "order_items(order_id)",
+    "idx_order_items_product_id": "order_items(product_id)",
+    "idx_orders_customer_email": "orders(customer_email)",
+    "idx_products_name": "products(name)",
+}
+
+DEFAULT_CHUNK_SIZE = 10_000
+
+ProductRow = Tuple[str, str, float, int]
+
+
 def seed_products(conn: sqlite3.Connection):
     cur = conn.cursor()
-    produits = [
-        ("PC Basic 8 Go", "Ordinateur de bureau simple, 8 Go RAM", 250.0, 15),
-        ("PC Gamer RTX", "PC gamer avec carte graphique RTX 4070", 1200.0, 5),
-        ("Serveur Entry", "Serveur d'entrée 4 cœurs, 16 Go RAM", 800.0, 3),
-        ("SSD 1To NVMe", "Disque SSD NVMe 1 To haute vitesse", 100.0, 20),
-        ("SSD 2To NVMe", "Disque SSD NVMe 2 To", 180.0, 10),
-        ("RAM 16 Go DDR4", "Barrette mémoire 16 Go DDR4", 60.0, 25),
-        ("RAM 32 Go DDR4", "Barrette mémoire 32 Go DDR4", 110.0, 10),
-        ("Moniteur 27\" 144Hz", "Moniteur 27 pouces, rafraîchissement 144 Hz", 300.0, 8),
-        ("Clavier Mécanique", "Clavier mécanique RGB", 80.0, 30),
-        ("Souris Gaming", "Souris gaming haute précision", 70.0, 30),
-    ]
-    for name, desc, price, stock in produits:
-        cur.execute("""
-        INSERT OR IGNORE INTO products(name, description, price, stock)
-        VALUES (?, ?, ?, ?)
-        """, (name, desc, price, stock))
+    cur.executemany("""
+    INSERT OR IGNORE INTO products(name, description, price, stock)
+    VALUES (?, ?, ?, ?)
+    """, SEED_PRODUCTS)
+    conn.commit()
+
+def create_indexes(conn: sqlite3.Connection):
+    """
+    Crée les index secondaires manquants (voir INDEXES) puis met à jour les
+    statistiques de l'optimiseur. À appeler après un chargement massif :
+    construire un index sur une table déjà remplie est bien plus rapide que
+    le maintenir ligne par ligne.
+    """
+    cur = conn.cursor()
+    for name, target in INDEXES.items():
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {name} ON {target};")
+    cur.execute("ANALYZE;")
     conn.commit()
 
-def main():
-    conn = sqlite3.connect(DB_PATH)
-    create_tables(conn)
-    seed_products(conn)
-    conn.close()
-    print("Base de données SunuTech créée à :", DB_PATH.resolve())
+def drop_indexes(conn: sqlite3.Connection):
+    """Supprime les index secondaires avant un chargement massif."""
+    cur = conn.cursor()
+    for name in INDEXES:
+        cur.execute(f"DROP INDEX IF EXISTS {name};")
+    conn.commit()
+
+def _chunked(rows: Iterable, size: int) -> Iterator[list]:
+    it = iter(rows)
+    while True:
+        chunk = list(islice(it, size))
+        if not chunk:
+            return
+        yield chunk
+
+def _bulk_insert(conn: sqlite3.Connection, sql: str, rows: Iterable[Sequence],
+                 chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """
+    Insère 'rows' par paquets de 'chunk_size' lignes, une transaction par
+    paquet (executemany). Le flux n'est jamais matérialisé en entier.
+    Retourne le nombre de lignes insérées.
+    """
+    total = 0
+    cur = conn.cursor()
+    for chunk in _chunked(rows, chunk_size):
+        cur.executemany(sql, chunk)
+        conn.commit()
+        total += len(chunk)
+    return total
+
+def _parse_product(record: dict, where: str) -> ProductRow:
+    try:
+        name = str(record["name"]).strip()
+        price = float(record["price"])
+        stock = int(record.get("stock") or 0)
+    except (KeyError, TypeError, ValueError) as e:
+        raise ValueError(f"Produit invalide ({where}) : {e}") from e
+    if not name:
+        raise ValueError(f"Produit invalide ({where}) : nom vide")
+    return name, str(record.get("description") or ""), price, stock
+
+def read_products(path: Path) -> Iterator[ProductRow]:
+    """
+    Lit un catalogue en flux depuis un fichier CSV (en-tête : name,
+    description, price, stock) ou JSONL (un objet par ligne, mêmes clés).
+    """
+    suffix = path.suffix.lower()
+    with path.open(encoding="utf-8", newline="") as f:
+        if suffix == ".csv":
+            for lineno, record in enumerate(csv.DictReader(f), start=2):
+                yield _parse_product(record, f"{path}:{lineno}")
+        elif suffix in (".jsonl", ".ndjson"):
+            for lineno, line in enumerate(f, start=1):
+                if line.strip():
+                    yield _parse_product(json.loads(line), f"{path}:{lineno}")
+        else:
+            raise ValueError(f"Format de catalogue non supporté : {path}")
+
+def validate_import(path: Path) -> int:
+    """
+    Lit tout le catalogue sans rien écrire : lève ValueError sur la première
+    ligne invalide. Retourne le nombre de produits.
+    """
+    return sum(1 for _ in read_products(path))
+
+def import_products(conn: sqlite3.Connection, path: Path,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> int:
+    """Importe un catalogue CSV/JSONL. Retourne le nombre de produits insérés."""
+    return _bulk_insert(
+        conn,
+        "INSERT INTO products(name, description, price, stock) VALUES (?, ?, ?, ?);",
+        read_products(path),
+        chunk_size,
+    )
+
+# --- Génération de données synthétiques ---
+_FAMILIES = [
+    ("PC Bureau", "Ordinateur de bureau", 200.0, 900.0),
+    ("PC Portable", "Ordinateur portable", 350.0, 2000.0),
+    ("PC Gamer", "PC gamer", 800.0, 3000.0),
+    ("Serveur", "Serveur rack", 700.0, 5000.0),
+    ("SSD", "Disque SSD", 40.0, 400.0),
+    ("HDD", "Disque dur", 35.0, 250.0),
+    ("RAM", "Barrette mémoire", 25.0, 300.0),
+    ("Moniteur", "Moniteur", 90.0, 900.0),
+    ("Clavier", "Clavier", 15.0, 200.0),
+    ("Souris", "Souris", 10.0, 150.0),
+]
+_VARIANTS = ["Eco", "Pro", "Plus", "Max", "Ultra", "Lite", "Air", "X", "S", "Elite"]
+_FIRST_NAMES = ["Awa", "Moussa", "Fatou", "Ibrahima", "Aminata", "Jean", "Marie",
+                "Yao", "Kofi", "Aïssatou", "Cheikh", "Mariama", "Pierre", "Koffi"]
+_LAST_NAMES = ["Diop", "Ndiaye", "Fall", "Sow", "Ba", "Kouadio", "Traoré",
+               "Dupont", "Camara", "Diallo", "Mensah", "Faye", "Gueye", "Sarr"]
+_CITIES = ["Dakar", "Abidjan", "Thiès", "Saint-Louis", "Bamako", "Lomé",
+           "Cotonou", "Ziguinchor", "Yamoussoukro", "Kaolack"]
+_STATUSES = ["PENDING", "PAID", "SHIPPED", "DELIVERED", "CANCELLED"]
+_STATUS_WEIGHTS = [10, 15, 20, 50, 5]
+
+def synthetic_products(n: int, rng: random.Random) -> Iterator[ProductRow]:
+    for i in range(1, n + 1):
+        label, desc, low, high = rng.choice(_FAMILIES)
+        variant = rng.choice(_VARIANTS)
+        yield (
+            f"{label} {variant} {i:06d}",
+            f"{desc} gamme {variant}",
+            round(rng.uniform(low, high), 2),
+            rng.randint(0, 200),
+        )
+
+def synthetic_customers(n: int, rng: random.Random) -> List[Tuple[str, str, str]]:
+    """Retourne 'n' clients (nom, email, adresse) ; les emails sont uniques."""
+    customers = []
+    for i in range(1, n + 1):
+        first, last = rng.choice(_FIRST_NAMES), rng.choice(_LAST_NAMES)
+        email = f"{first.lower()}.{last.lower()}.{i}@example.com"
+        address = f"{rng.randint(1, 300)} rue {rng.randint(1, 99)}, {rng.choice(_CITIES)}"
+        customers.append((f"{first} {last}", email, address))
+    return customers
+
+def generate_orders(conn: sqlite3.Connection, n_orders: int,
+                    customers: Sequence[Tuple[str, str, str]], rng: random.Random,
+                    max_items: int = 4,
+                    chunk_size: int = DEFAULT_CHUNK_SIZE) -> Tuple[int, int]:
+    """
+    Génère 'n_orders' commandes historiques (et leurs lignes) sur le catalogue
+    existant. Les IDs sont attribués côté Python pour relier order_items sans
+    relire lastrowid ; le stock n'est pas décrémenté.
+    Retourne (nb commandes, nb lignes).
+    """
+    cur = conn.cursor()
+    cur.execute("SELECT id, price FROM products ORDER BY id;")
+    catalog = cur.fetchall()
+    if not catalog:
+        raise ValueError("Catalogue vide : impossible de générer des commandes.")
+    if not customers:
+        raise ValueError("Aucun client : impossible de générer des commandes.")
+    cur.execute("SELECT COALESCE(MAX(id), 0) FROM orders;")
+    next_id = cur.fetchone()[0] + 1
+
+    n_done = n_items = 0
+    while n_done < n_orders:
+        batch = min(chunk_size, n_orders - n_done)
+        orders, items = [], []
+        for order_id in range(next_id, next_id + batch):
+            name, email, address = rng.choice(customers)
+            total = 0.0
+            for _ in range(rng.randint(1, max_items)):
+                pid, price = rng.choice(catalog)
+                qty = rng.randint(1, 3)
+                items.append((order_id, pid, qty, price))
+                total += price * qty
+            status = rng.choices(_STATUSES, _STATUS_WEIGHTS)[0]
+            orders.append((order_id, name, email, address, round(total, 2), status))
+        cur.executemany(
+            "INSERT INTO orders(id, customer_name, customer_email, address, total_amount, status) "
+            "VALUES (?, ?, ?, ?, ?, ?);",
+            orders,
+        )
+        cur.executemany(
+            "INSERT INTO order_items(order_id, product_id, quantity, price_each) "
+            "VALUES (?, ?, ?, ?);",
+            items,
+        )
+        conn.commit()
+        next_id += batch
+        n_done += batch
+        n_items += len(items)
+    return n_done, n_items
+
+def _connect_for_bulk(db_path: Path) -> sqlite3.Connection:
+    conn = sqlite3.connect(db_path)
+    # Réglages valables pour cette connexion uniquement : pas de fsync à
+    # chaque commit et tables temporaires (tri des index) en mémoire.
+    conn.execute("PRAGMA synchronous = OFF;")
+    conn.execute("PRAGMA temp_store = MEMORY;")
+    return conn
+
+def parse_args(argv: Optional[Sequence[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Crée et alimente la base SQLite SunuTech.")
+    parser.add_argument("--db", type=Path, default=DB_PATH,
+                        help=f"chemin de la base (défaut : {DB_PATH})")
+    parser.add_argument("--no-seed", action="store_true",
+                        help="ne pas insérer les 10 produits par défaut")
+    parser.add_argument("--import", dest="import_paths", type=Path,
+                        action="append", default=[], metavar="FICHIER",
+                        help="catalogue CSV ou JSONL à importer (répétable)")
+    parser.add_argument("--products", type=int, default=0,
+                        help="nombre de produits synthétiques à générer")
+    parser.add_argument("--customers", type=int, default=1000,
+                        help="taille du pool de clients synthétiques")
+    parser.add_argument("--orders", type=int, default=0,
+                        help="nombre de commandes synthétiques à générer")
+    parser.add_argument("--seed", type=int, default=42,
+                        help="graine du générateur aléatoire")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE,
+                        help="lignes par transaction executemany")
+    return parser.parse_args(argv)
+
+def _load(conn: sqlite3.Connection, args: argparse.Namespace):
+    bulk = bool(args.import_paths or args.products or args.orders)
+    if not args.no_seed:
+        seed_products(conn)
+
+    start = time.perf_counter()
+    for path in args.import_paths:
+        n = import_products(conn, path, args.chunk_size)
+        print(f"{n} produits importés depuis {path}")
+
+    rng = random.Random(args.seed)
+    if args.products:
+        n = _bulk_insert(
+            conn,
+            "INSERT INTO products(name, description, price, stock) VALUES (?, ?, ?, ?);",
+            synthetic_products(args.products, rng),
+            args.chunk_size,
+        )
+        print(f"{n} produits synthétiques générés")
+    if args.orders:
+        customers = synthetic_customers(args.customers, rng)
+        n_orders, n_items = generate_orders(
+            conn, args.orders, customers, rng, chunk_size=args.chunk_size)
+        print(f"{n_orders} commandes / {n_items} lignes générées "
+              f"pour {len(customers)} clients")
+
+    if bulk:
+        print(f"Chargement terminé en {time.perf_counter() - start:.1f} s")
+
+def main(argv: Optional[Sequence[str]] = None):
+    args = parse_args(argv)
+    # un fichier invalide est refusé avant toute modification de la base
+    for path in args.import_paths:
+        validate_import(path)
+    bulk = bool(args.import_paths or args.products or args.orders)
+    conn = _connect_for_bulk(args.db) if bulk else sqlite3.connect(args.db)
+    try:
+        create_tables(conn)
+        if bulk:
+            drop_indexes(conn)
+        try:
+            _load(conn, args)
+        finally:
+            # même après un échec, la base garde ses index (sans valider
+            # le paquet en cours d'insertion)
+            conn.rollback()
+            create_indexes(conn)
+    finally:
+        conn.close()
+    print("Base de données SunuTech créée à :", args.db.resolve())
 
 if __name__ == "__main__":
     main()
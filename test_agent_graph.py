@@ -0,0 +1,62 @@
+# test_agent_graph.py
+"""
+Tests du graphe avec les backends locaux (SUNUTECH_FAKE_BACKENDS), sans
+réseau ni base de données réelle :
+
+    python -m unittest test_agent_graph
+"""
+
+import os
+import time
+import unittest
+
+os.environ["SUNUTECH_FAKE_BACKENDS"] = "1"
+
+from langchain_core.messages import HumanMessage  # noqa: E402
+
+import agent_graph  # noqa: E402
+from resilience import UPSTREAMS, CircuitBreaker  # noqa: E402
+from tools import get_order_status  # noqa: E402
+
+
+class ToolsUpstreamDegradedTest(unittest.TestCase):
+    """Outils indisponibles (budget épuisé, disjoncteur ouvert) : réponse, pas d'exception."""
+
+    def setUp(self):
+        self._breaker = UPSTREAMS["tools"].breaker
+        UPSTREAMS["tools"].breaker = CircuitBreaker("tools", failures=1, reset_timeout=60)
+
+    def tearDown(self):
+        UPSTREAMS["tools"].breaker = self._breaker
+
+    def _open_breaker(self):
+        UPSTREAMS["tools"].breaker.record_failure()
+        self.assertEqual(UPSTREAMS["tools"].breaker.state, "open")
+
+    def test_expired_deadline(self):
+        state = {"deadline": time.time() - 1}
+        answer = agent_graph._safe_tool_call(get_order_status, {"order_id": 12}, state)
+        self.assertTrue(answer.startswith("[outil:get_order_status] erreur"), answer)
+
+    def test_open_breaker(self):
+        self._open_breaker()
+        answer = agent_graph._safe_tool_call(get_order_status, {"order_id": 12}, {})
+        self.assertTrue(answer.startswith("[outil:get_order_status] erreur"), answer)
+        self.assertIn("disjoncteur", answer)
+
+    def test_invalid_arguments_do_not_trip_the_breaker(self):
+        for _ in range(3):
+            answer = agent_graph._safe_tool_call(get_order_status, {"order_id": "abc"}, {})
+            self.assertTrue(answer.startswith("[outil:get_order_status] erreur"), answer)
+        self.assertEqual(UPSTREAMS["tools"].breaker.state, "closed")
+
+    def test_graph_answers_order_status_with_open_breaker(self):
+        self._open_breaker()
+        query = "Quel est le statut de la commande 12 ?"
+        state = agent_graph.GRAPH.invoke({"messages": [HumanMessage(content=query)],
+                                          "user_query": query})
+        self.assertIn("[outil:get_order_status] erreur", state["answer"])
+
+
+if __name__ == "__main__":
+    unittest.main()
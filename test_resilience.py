@@ -0,0 +1,277 @@
+# test_resilience.py
+"""
+Tests du disjoncteur et des appels protégés (resilience.py), sans réseau :
+
+    python -m unittest test_resilience
+"""
+
+import itertools
+import time
+import unittest
+
+from resilience import (HEDGE_MIN_SAMPLES, CircuitBreaker, CircuitOpen, DeadlineExceeded,
+                        Upstream, is_transient, new_deadline, percentile, remaining)
+
+
+def _failing():
+    raise ConnectionError("amont indisponible")
+
+
+def _upstream(timeout: float = 1.0, retries: int = 0, failures: int = 2,
+              reset_timeout: float = 0.05) -> Upstream:
+    upstream = Upstream("test", timeout, retries=retries)
+    upstream.breaker = CircuitBreaker("test", failures=failures, reset_timeout=reset_timeout)
+    return upstream
+
+
+def _flaky(failures: int):
+    """Échoue 'failures' fois puis répond "ok" ; compte les appels."""
+    counter = itertools.count(1)
+
+    def fn():
+        fn.calls = next(counter)
+        if fn.calls <= failures:
+            raise ConnectionError("erreur transitoire")
+        return "ok"
+    fn.calls = 0
+    return fn
+
+
+class _StatusError(Exception):
+    """Erreur HTTP à la manière des clients (openai.APIStatusError...)."""
+
+    def __init__(self, status_code: int):
+        super().__init__(f"HTTP {status_code}")
+        self.status_code = status_code
+
+
+def _raising(exc: Exception):
+    """Lève toujours 'exc' ; compte les appels."""
+    counter = itertools.count(1)
+
+    def fn():
+        fn.calls = next(counter)
+        raise exc
+    fn.calls = 0
+    return fn
+
+
+def _slow_first(delay: float):
+    """Le premier appel est lent, les suivants immédiats."""
+    counter = itertools.count(1)
+
+    def fn():
+        fn.calls = next(counter)
+        if fn.calls == 1:
+            time.sleep(delay)
+        return "ok"
+    fn.calls = 0
+    return fn
+
+
+def _open(upstream: Upstream):
+    for _ in range(upstream.breaker.failures):
+        try:
+            upstream.call(_failing)
+        except ConnectionError:
+            pass
+    assert upstream.breaker.state == "open"
+
+
+class CircuitBreakerTest(unittest.TestCase):
+    def test_opens_after_consecutive_failures(self):
+        breaker = CircuitBreaker("b", failures=3, reset_timeout=60)
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_success()
+        for _ in range(2):
+            breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        self.assertFalse(breaker.allow())
+
+    def test_half_open_allows_a_single_probe(self):
+        breaker = CircuitBreaker("b", failures=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertEqual(breaker.state, "half_open")
+        self.assertTrue(breaker.allow())
+        self.assertFalse(breaker.allow())
+
+    def test_probe_success_closes(self):
+        breaker = CircuitBreaker("b", failures=1, reset_timeout=0.05)
+        breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+        self.assertTrue(breaker.allow())
+
+    def test_probe_failure_reopens(self):
+        breaker = CircuitBreaker("b", failures=5, reset_timeout=0.05)
+        for _ in range(5):
+            breaker.record_failure()
+        time.sleep(0.06)
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+
+class PercentileTest(unittest.TestCase):
+    def test_nearest_rank(self):
+        values = list(range(1, 101))
+        self.assertEqual(percentile(values, 0.50), 50)
+        self.assertEqual(percentile(values, 0.95), 95)
+        self.assertEqual(percentile(values, 0.99), 99)
+        self.assertEqual(percentile(values, 1.0), 100)
+
+    def test_small_samples(self):
+        self.assertEqual(percentile([], 0.5), 0.0)
+        self.assertEqual(percentile([7.0], 0.99), 7.0)
+        self.assertEqual(percentile([1, 2], 0.5), 1)
+        self.assertEqual(percentile(list(range(1, 21)), 0.95), 19)
+
+
+class UpstreamBreakerTest(unittest.TestCase):
+    def test_open_breaker_refuses_without_calling(self):
+        upstream = _upstream(reset_timeout=60)
+        _open(upstream)
+        calls = []
+        with self.assertRaises(CircuitOpen):
+            upstream.call(lambda: calls.append(1))
+        self.assertEqual(calls, [])
+
+    def test_expired_deadline_does_not_hold_the_half_open_probe(self):
+        upstream = _upstream()
+        _open(upstream)
+        time.sleep(0.06)
+        self.assertEqual(upstream.breaker.state, "half_open")
+        with self.assertRaises(DeadlineExceeded):
+            upstream.call(lambda: "ok", deadline=time.time() - 1)
+        # l'appel d'essai reste disponible : le disjoncteur peut se refermer
+        self.assertEqual(upstream.call(lambda: "ok"), "ok")
+        self.assertEqual(upstream.breaker.state, "closed")
+
+
+class UpstreamTimeoutTest(unittest.TestCase):
+    def test_budget_truncation_is_not_an_upstream_failure(self):
+        upstream = _upstream(timeout=1.0, failures=2)
+        for _ in range(3):
+            with self.assertRaises(DeadlineExceeded):
+                upstream.call(lambda: time.sleep(0.3), deadline=new_deadline(0.05))
+        self.assertEqual(upstream.breaker.state, "closed")
+        self.assertEqual(upstream.breaker._consecutive, 0)
+
+    def test_own_timeout_is_an_upstream_failure(self):
+        upstream = _upstream(timeout=0.05, failures=2)
+        for _ in range(2):
+            with self.assertRaises(DeadlineExceeded):
+                upstream.call(lambda: time.sleep(0.3), deadline=new_deadline(10))
+        self.assertEqual(upstream.breaker.state, "open")
+
+    def test_truncated_probe_is_released(self):
+        upstream = _upstream(timeout=1.0)
+        _open(upstream)
+        time.sleep(0.06)
+        with self.assertRaises(DeadlineExceeded):
+            upstream.call(lambda: time.sleep(0.3), deadline=new_deadline(0.05))
+        self.assertEqual(upstream.breaker.state, "half_open")
+        self.assertEqual(upstream.call(lambda: "ok"), "ok")
+
+    def test_deadline_caps_each_call(self):
+        upstream = _upstream(timeout=5.0)
+        started = time.monotonic()
+        with self.assertRaises(DeadlineExceeded):
+            upstream.call(lambda: time.sleep(1.0), deadline=new_deadline(0.1))
+        self.assertLess(time.monotonic() - started, 0.5)
+
+    def test_no_deadline_means_no_cap(self):
+        self.assertEqual(remaining(None), float("inf"))
+        self.assertEqual(_upstream(timeout=1.0).call(lambda: "ok", deadline=None), "ok")
+
+
+class UpstreamRetryTest(unittest.TestCase):
+    def test_idempotent_call_is_retried(self):
+        upstream = _upstream(retries=2, failures=5)
+        fn = _flaky(2)
+        self.assertEqual(upstream.call(fn, deadline=new_deadline(10)), "ok")
+        self.assertEqual(fn.calls, 3)
+        self.assertEqual(upstream.breaker.state, "closed")
+
+    def test_non_idempotent_call_is_tried_once(self):
+        upstream = _upstream(retries=2, failures=5)
+        fn = _flaky(1)
+        with self.assertRaises(ConnectionError):
+            upstream.call(fn, deadline=new_deadline(10), idempotent=False)
+        self.assertEqual(fn.calls, 1)
+
+    def test_no_retry_past_the_deadline(self):
+        upstream = _upstream(retries=5, failures=10)
+        fn = _flaky(100)
+        with self.assertRaises(ConnectionError):
+            upstream.call(fn, deadline=new_deadline(0.05))
+        self.assertLess(fn.calls, 6)
+
+    def test_transient_status_is_retried(self):
+        for status in (429, 503):
+            upstream = _upstream(retries=2, failures=5)
+            fn = _raising(_StatusError(status))
+            with self.assertRaises(_StatusError):
+                upstream.call(fn, deadline=new_deadline(10))
+            self.assertEqual(fn.calls, 3)
+            self.assertEqual(upstream.breaker._consecutive, 3)
+
+    def test_non_transient_error_is_raised_at_once(self):
+        for exc in (ValueError("argument invalide"), _StatusError(400)):
+            upstream = _upstream(retries=2, failures=1)
+            fn = _raising(exc)
+            with self.assertRaises(type(exc)):
+                upstream.call(fn, deadline=new_deadline(10))
+            self.assertEqual(fn.calls, 1)
+            self.assertEqual(upstream.breaker.state, "closed")
+
+    def test_non_transient_error_releases_the_probe(self):
+        upstream = _upstream()
+        _open(upstream)
+        time.sleep(0.06)
+        with self.assertRaises(ValueError):
+            upstream.call(_raising(ValueError("argument invalide")))
+        self.assertEqual(upstream.breaker.state, "half_open")
+        self.assertEqual(upstream.call(lambda: "ok"), "ok")
+        self.assertEqual(upstream.breaker.state, "closed")
+
+    def test_classification(self):
+        self.assertTrue(is_transient(TimeoutError()))
+        self.assertTrue(is_transient(ConnectionResetError()))
+        self.assertTrue(is_transient(_StatusError(502)))
+        self.assertFalse(is_transient(_StatusError(404)))
+        self.assertFalse(is_transient(KeyError("x")))
+
+
+class UpstreamHedgeTest(unittest.TestCase):
+    def _hedged(self) -> Upstream:
+        upstream = _upstream(timeout=2.0)
+        upstream.hedge = True
+        for _ in range(HEDGE_MIN_SAMPLES):
+            upstream.latency.add(0.01)
+        return upstream
+
+    def test_slow_call_is_hedged_after_p95(self):
+        upstream = self._hedged()
+        fn = _slow_first(0.5)
+        started = time.monotonic()
+        self.assertEqual(upstream.call(fn), "ok")
+        self.assertLess(time.monotonic() - started, 0.3)
+        self.assertEqual(fn.calls, 2)
+
+    def test_non_idempotent_call_is_not_hedged(self):
+        upstream = self._hedged()
+        fn = _slow_first(0.2)
+        upstream.call(fn, idempotent=False)
+        self.assertEqual(fn.calls, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -2,12 +2,60 @@
 
 from pathlib import Path
 import sqlite3
-from typing import Any, Dict, Optional
+import threading
+import time
+from typing import Any, Dict, List, Optional, Sequence
 
 from langchain_core.tools import tool
 
 DB_PATH = Path("sunutech_db.sqlite")
 
+# Pagination des recherches de commandes
+ORDERS_PAGE_SIZE = 10
+MAX_ORDERS_PAGE_SIZE = 50
+
+
+# Attente du verrou d'écriture SQLite (create_order), pour les tests de charge
+_db_stats = {"write_txns": 0, "lock_waits": 0, "lock_wait_s": 0.0,
+             "lock_wait_max_s": 0.0, "lock_errors": 0}
+_db_stats_lock = threading.Lock()
+# au-delà, une attente compte comme contention (et non comme simple écriture)
+LOCK_WAIT_THRESHOLD = 0.001
+
+
+def db_stats() -> Dict[str, float]:
+    with _db_stats_lock:
+        return dict(_db_stats)
+
+
+def reset_db_stats() -> None:
+    with _db_stats_lock:
+        for key in _db_stats:
+            _db_stats[key] = 0
+
+
+def _take_write_lock(cur: sqlite3.Cursor, sql: str, params: Sequence[Any] = ()) -> None:
+    """
+    Exécute l'instruction qui prend le verrou d'écriture SQLite d'une
+    transaction ; son temps (attente du verrou comprise) est comptabilisé
+    dans db_stats().
+    """
+    start = time.perf_counter()
+    try:
+        cur.execute(sql, params)
+    except sqlite3.OperationalError as e:
+        if "locked" in str(e):
+            with _db_stats_lock:
+                _db_stats["lock_errors"] += 1
+        raise
+    waited = time.perf_counter() - start
+    with _db_stats_lock:
+        _db_stats["write_txns"] += 1
+        if waited > LOCK_WAIT_THRESHOLD:
+            _db_stats["lock_waits"] += 1
+            _db_stats["lock_wait_s"] += waited
+            _db_stats["lock_wait_max_s"] = max(_db_stats["lock_wait_max_s"], waited)
+
 
 def _get_connection() -> sqlite3.Connection:
     if not DB_PATH.exists():
@@ -87,29 +135,98 @@ def check_product_inventory(product_name: str) -> str:
             pass
 
 
+def fetch_orders(
+    conn: sqlite3.Connection,
+    order_ids: Optional[Sequence[int]] = None,
+    customer_email: Optional[str] = None,
+    limit: int = ORDERS_PAGE_SIZE,
+    offset: int = 0,
+) -> List[Dict[str, Any]]:
+    """
+    Charge une page de commandes (par liste d'IDs ou par email client) avec
+    leurs lignes et le nom des produits, en une seule requête : la page
+    d'IDs est sélectionnée dans une CTE (index orders(customer_email)), puis
+    jointe à order_items (index order_items(order_id)) et products.
+    Les commandes sont triées de la plus récente à la plus ancienne.
+    """
+    if order_ids:
+        ids = list(dict.fromkeys(int(i) for i in order_ids))
+        where = f"id IN ({', '.join('?' * len(ids))})"
+        params: List[Any] = ids
+    elif customer_email:
+        where = "customer_email = ?"
+        params = [customer_email.strip()]
+    else:
+        raise ValueError("Préciser 'order_ids' ou 'customer_email'.")
+
+    cur = conn.cursor()
+    cur.execute(
+        f"WITH page AS ("
+        f"  SELECT id FROM orders WHERE {where} ORDER BY id DESC LIMIT ? OFFSET ?"
+        f") "
+        "SELECT o.id, o.customer_name, o.customer_email, o.address, o.total_amount, o.status, "
+        "       oi.product_id, oi.quantity, oi.price_each, p.name AS product_name "
+        "FROM page "
+        "JOIN orders o ON o.id = page.id "
+        "LEFT JOIN order_items oi ON oi.order_id = o.id "
+        "LEFT JOIN products p ON p.id = oi.product_id "
+        "ORDER BY o.id DESC, oi.id;",
+        (*params, limit, offset),
+    )
+
+    orders: Dict[int, Dict[str, Any]] = {}
+    for r in cur.fetchall():
+        order = orders.get(r["id"])
+        if order is None:
+            order = orders[r["id"]] = {
+                "id": r["id"],
+                "customer_name": r["customer_name"],
+                "customer_email": r["customer_email"],
+                "address": r["address"],
+                "total_amount": r["total_amount"],
+                "status": r["status"],
+                "items": [],
+            }
+        if r["product_id"] is not None:
+            order["items"].append({
+                "product_id": r["product_id"],
+                "product_name": r["product_name"] or f"Produit {r['product_id']}",
+                "quantity": r["quantity"],
+                "price_each": r["price_each"],
+            })
+    return list(orders.values())
+
+
+def _format_order_items(order: Dict[str, Any]) -> List[str]:
+    return [
+        f"  - {it['quantity']} × {it['product_name']} ({it['price_each']:.2f} €)"
+        for it in order["items"]
+    ]
+
+
 @tool
 def get_order_status(order_id: int) -> str:
     """
     Renvoie le statut d'une commande par son ID.
-    Retourne un résumé (client, montant, statut) ou un message si introuvable/erreur.
+    Retourne un résumé (client, montant, statut, articles) ou un message si introuvable/erreur.
     """
     conn: Optional[sqlite3.Connection] = None
     try:
         conn = _get_connection()
-        cur = conn.cursor()
-        cur.execute(
-            "SELECT status, total_amount, customer_name FROM orders WHERE id = ?;",
-            (order_id,),
-        )
-        row = cur.fetchone()
-        if row is None:
+        orders = fetch_orders(conn, order_ids=[order_id], limit=1)
+        if not orders:
             return f"Aucune commande trouvée pour l'ID {order_id}."
-        return (
-            f"Commande ID {order_id}\n"
-            f"Client : {row['customer_name']}\n"
-            f"Montant : {row['total_amount']:.2f} €\n"
-            f"Statut : {row['status']}"
-        )
+        order = orders[0]
+        lines = [
+            f"Commande ID {order['id']}",
+            f"Client : {order['customer_name']}",
+            f"Montant : {order['total_amount']:.2f} €",
+            f"Statut : {order['status']}",
+        ]
+        if order["items"]:
+            lines.append("Articles :")
+            lines.extend(_format_order_items(order))
+        return "\n".join(lines)
     except Exception as e:
         return f"Erreur dans get_order_status : {e}"
     finally:
@@ -120,6 +237,69 @@ def get_order_status(order_id: int) -> str:
             pass
 
 
+@tool
+def lookup_orders(
+    order_ids: Optional[List[int]] = None,
+    customer_email: Optional[str] = None,
+    page: int = 1,
+    page_size: int = ORDERS_PAGE_SIZE,
+) -> str:
+    """
+    Recherche une ou plusieurs commandes, soit par liste d'IDs ('order_ids'),
+    soit par email client ('customer_email'), avec leurs articles.
+    Résultats paginés ('page' commence à 1, 'page_size' <= 50), du plus récent
+    au plus ancien. Retourne un texte compact (sans nom de client), ou un
+    message si introuvable/erreur. L'appelant vérifie que l'email est celui
+    du client authentifié : l'outil ne connaît pas la session.
+    """
+    conn: Optional[sqlite3.Connection] = None
+    try:
+        if not order_ids and not customer_email:
+            return "Veuillez préciser des numéros de commande ou un email client."
+        if order_ids and len(order_ids) > MAX_ORDERS_PAGE_SIZE:
+            return f"Trop de commandes demandées (maximum {MAX_ORDERS_PAGE_SIZE})."
+        page = max(1, int(page))
+        page_size = min(max(1, int(page_size)), MAX_ORDERS_PAGE_SIZE)
+
+        conn = _get_connection()
+        # une commande de plus que la page pour savoir s'il en reste
+        orders = fetch_orders(
+            conn,
+            order_ids=order_ids,
+            customer_email=None if order_ids else customer_email,
+            limit=page_size + 1,
+            offset=(page - 1) * page_size,
+        )
+        has_more = len(orders) > page_size
+        orders = orders[:page_size]
+        if not orders:
+            target = (f"les IDs {', '.join(str(i) for i in order_ids)}"
+                      if order_ids else f"« {customer_email} »")
+            return f"Aucune commande trouvée pour {target}."
+
+        chunks = []
+        for o in orders:
+            lines = [f"#{o['id']} {o['status']} — {o['total_amount']:.2f} €"]
+            lines.extend(_format_order_items(o))
+            chunks.append("\n".join(lines))
+        if order_ids and page == 1 and not has_more:
+            found = {o["id"] for o in orders}
+            missing = [str(i) for i in order_ids if int(i) not in found]
+            if missing:
+                chunks.append(f"Introuvables : {', '.join(missing)}")
+        if has_more:
+            chunks.append(f"… d'autres commandes existent (page={page + 1}).")
+        return "\n".join(chunks)
+    except Exception as e:
+        return f"Erreur dans lookup_orders : {e}"
+    finally:
+        try:
+            if conn is not None:
+                conn.close()
+        except:
+            pass
+
+
 @tool
 def create_order(order_details: Dict[str, Any]) -> str:
     """
@@ -140,6 +320,9 @@ def create_order(order_details: Dict[str, Any]) -> str:
     try:
         conn = _get_connection()
         cur = conn.cursor()
+        # verrou d'écriture pris avant de lire le stock : vérification et
+        # décrément sont atomiques face aux commandes concurrentes
+        _take_write_lock(cur, "BEGIN IMMEDIATE;")
 
         total_amount = 0.0
 